@@ -1,51 +1,75 @@
+import asyncio
+import contextvars
+import json
+import sys
+import threading
+from typing import Any, List, TypedDict
+
 from langgraph.graph import StateGraph, START, END
 from agentic_core import SymbolicAgent, KnowledgeAgent, ReasoningAgent
-from memory_manager import MemoryManager
+from instrumentation import traced
+from memory_manager import MemoryManager, MemoryWriteBuffer
 
 memory = MemoryManager()
 
+# Per-run settings, seen by every node of the runs started in the current context
+_quiet = contextvars.ContextVar("quiet", default=False)
+_memory_writer = contextvars.ContextVar("memory_writer", default=None)
+
+
+def _log(*args):
+    if not _quiet.get():
+        print(*args)
+
 # =====================================================
 # 🧩 Step 1: Define Shared State
 # =====================================================
-class GraphState(dict):
-    pass
+class GraphState(TypedDict, total=False):
+    # LangGraph only passes declared keys between nodes
+    query: str
+    facts: List[str]
+    equation_result: Any
+    explanation: str
 
 
 # =====================================================
 # 🧠 Step 2: Initialize Agents
 # =====================================================
 symbolic_agent = SymbolicAgent()
-knowledge_agent = KnowledgeAgent()
-reasoning_agent = ReasoningAgent()
+knowledge_agent = KnowledgeAgent(memory)
+reasoning_agent = ReasoningAgent(memory)
 
 
 # =====================================================
 # 🧩 Step 3: Node Functions
 # =====================================================
+@traced("graph.retrieve_knowledge")
 def retrieve_knowledge(state: GraphState):
     query = state.get("query", "")
     facts = knowledge_agent.search(query)
     state["facts"] = facts
-    print("\n📚 Retrieved Facts:")
+    _log("\n📚 Retrieved Facts:")
     for f in facts:
-        print(" -", f)
+        _log(" -", f)
     return state
 
 
+@traced("graph.compute_equation")
 def compute_equation(state: GraphState):
     result = symbolic_agent.evaluate(6.674e-11, 1e-52, 9e-27)
     state["equation_result"] = result
-    print("\n🧮 Computed symbolic result:", result)
+    _log("\n🧮 Computed symbolic result:", result)
     return state
 
 
+@traced("graph.reason_result")
 def reason_result(state: GraphState):
     facts = state.get("facts", [])
     eq_result = state.get("equation_result", None)
     explanation = reasoning_agent.interpret(eq_result, facts)
 
-    # Save memory here
-    memory.add_entry(
+    # Save memory here (buffered during batch runs)
+    (_memory_writer.get() or memory).add_entry(
         state.get("query", ""),
         state.get("facts", []),
         state.get("equation_result", ""),
@@ -53,8 +77,8 @@ def reason_result(state: GraphState):
     )
 
     state["explanation"] = explanation
-    print("\n💡 Generated Explanation:")
-    print(explanation)
+    _log("\n💡 Generated Explanation:")
+    _log(explanation)
     return state
 
 
@@ -71,30 +95,109 @@ def output_final_state(state: GraphState):
 # =====================================================
 # 🧠 Step 4: Build Graph
 # =====================================================
-workflow = StateGraph(GraphState)
+def build_graph():
+    workflow = StateGraph(GraphState)
+
+    workflow.add_node("retriever", retrieve_knowledge)
+    workflow.add_node("symbolic_math", compute_equation)
+    workflow.add_node("reasoner", reason_result)
+    workflow.add_node("output", output_final_state)
+
+    workflow.add_edge(START, "retriever")
+    workflow.add_edge("retriever", "symbolic_math")
+    workflow.add_edge("symbolic_math", "reasoner")
+    workflow.add_edge("reasoner", "output")
+    workflow.add_edge("output", END)
+
+    return workflow.compile()
+
 
-workflow.add_node("retriever", retrieve_knowledge)
-workflow.add_node("symbolic_math", compute_equation)
-workflow.add_node("reasoner", reason_result)
-workflow.add_node("output", output_final_state)
+_graph = None
+_graph_lock = threading.Lock()
 
-workflow.add_edge(START, "retriever")
-workflow.add_edge("retriever", "symbolic_math")
-workflow.add_edge("symbolic_math", "reasoner")
-workflow.add_edge("reasoner", "output")
-workflow.add_edge("output", END)
 
-graph = workflow.compile()
+def get_graph():
+    """The compiled graph, built on first use."""
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = build_graph()
+    return _graph
+
+
+def __getattr__(name):
+    # `from agent_graph import graph` keeps working without compiling at import
+    if name == "graph":
+        return get_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# =====================================================
+# 📦 Step 5: Batch Execution
+# =====================================================
+def _structured(query, result):
+    if isinstance(result, BaseException):
+        error = f"{type(result).__name__}: {result}"
+    elif not isinstance(result, dict):
+        error = f"Graph returned {type(result).__name__} instead of a state dict"
+    else:
+        return dict(output_final_state(result), error=None)
+    return {"query": query, "facts": None, "equation_result": None, "explanation": None, "error": error}
+
+
+async def arun_queries(queries, max_concurrency=8, quiet=True, flush_every=100):
+    """Run many queries through the graph concurrently.
+
+    At most `max_concurrency` runs are in flight; memory entries are
+    buffered and written `flush_every` at a time (the rest when the batch
+    ends). Returns one dict per query, in input order, with the
+    output_final_state fields plus "error" (None on success), so one failing
+    query does not abort the batch.
+    """
+    queries = list(queries)
+    writer = MemoryWriteBuffer(memory, flush_every)
+    quiet_token = _quiet.set(quiet)
+    writer_token = _memory_writer.set(writer)
+    try:
+        results = await get_graph().abatch(
+            [{"query": q} for q in queries],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+    finally:
+        _memory_writer.reset(writer_token)
+        _quiet.reset(quiet_token)
+        writer.flush()
+    return [_structured(q, r) for q, r in zip(queries, results)]
+
+
+def run_queries(queries, **kwargs):
+    """Synchronous wrapper around arun_queries."""
+    return asyncio.run(arun_queries(queries, **kwargs))
 
 
 # =====================================================
-# 🚀 Step 5: Execute
+# 🚀 Step 6: Execute
 # =====================================================
-if __name__ == "__main__":
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Batch replay: python src/agent_graph.py questions.txt [results.jsonl]
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+    output_path = sys.argv[2] if len(sys.argv) > 2 else "data/graph_results.jsonl"
+
+    results = run_queries(queries)
+    with open(output_path, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    failed = sum(r["error"] is not None for r in results)
+    print(f"✅ {len(results)} queries answered ({failed} failed), results in {output_path}")
+
+elif __name__ == "__main__":
     query = "relationship between dark energy and universe expansion"
     print(f"\n🧠 Running agent graph for query: {query}\n")
 
-    result = graph.invoke({"query": query})
+    result = get_graph().invoke({"query": query})
 
     print("\n✅ Agent Graph Completed.\n")
 
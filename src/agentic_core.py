@@ -2,30 +2,34 @@
 # agentic_core.py — Core Agents for Cosmosym
 # ============================================================
 
-from sympy import symbols, Eq, solve, pi
-from sentence_transformers import SentenceTransformer
 from memory_manager import MemoryManager
+from compiled_eval import compile_expression
+from embedding_registry import DEFAULT_MODEL, get_model
+
+# Simplified Friedmann equation: H² = (8πGρ)/3 + (Λc²)/3
+FRIEDMANN_RHS = "8*pi*G*rho/3 + Lambda/3"
 
 # ============================================================
 # 🔢 Symbolic Agent — Handles Cosmology Equations
 # ============================================================
 class SymbolicAgent:
     def __init__(self):
-        self.model_name = "all-MiniLM-L6-v2"
-        self.embedding = SentenceTransformer(self.model_name)
+        self.model_name = DEFAULT_MODEL
 
-    def evaluate(self, G_value, rho_value, Lambda_value):
-        """Compute simplified Friedmann-like relation."""
-        try:
-            G, rho, Lambda = symbols('G rho Lambda')
-            H = symbols('H')
+    @property
+    def embedding(self):
+        """Shared sentence-transformer, loaded on first access (see embedding_registry)."""
+        return get_model(self.model_name)
 
-            # Simplified Friedmann equation: H² = (8πGρ)/3 + (Λc²)/3
-            eq = Eq(H**2, (8 * pi * G * rho) / 3 + (Lambda / 3))
+    def evaluate(self, G_value, rho_value, Lambda_value):
+        """Compute simplified Friedmann-like relation.
 
-            # Substitute sample constants
-            result = eq.rhs.subs({G: G_value, rho: rho_value, Lambda: Lambda_value})
-            return result
+        Accepts scalars or NumPy arrays (broadcast against each other) and
+        returns H² as a float or a vector, via a cached compiled function.
+        """
+        try:
+            friedmann = compile_expression(FRIEDMANN_RHS, ("G", "rho", "Lambda"))
+            return friedmann(G_value, rho_value, Lambda_value)
         except Exception as e:
             return f"Error: {e}"
 
@@ -34,8 +38,8 @@ class SymbolicAgent:
 # 📚 Knowledge Agent — Retrieves Contextual Facts
 # ============================================================
 class KnowledgeAgent:
-    def __init__(self):
-        self.memory = MemoryManager()
+    def __init__(self, memory=None):
+        self.memory = memory or MemoryManager()
 
     def search(self, query):
         """Retrieve knowledge or context for a query."""
@@ -47,7 +51,7 @@ class KnowledgeAgent:
         ]
 
         # Include previous memory entries if available
-        past_entries = self.memory.search_memory(query)
+        past_entries = self.memory.search_memory(query, limit=5)
         if past_entries:
             for entry in past_entries:
                 if entry["facts"]:
@@ -60,13 +64,13 @@ class KnowledgeAgent:
 # 🧠 Reasoning Agent — Interprets and Learns from Memory
 # ============================================================
 class ReasoningAgent:
-    def __init__(self):
-        self.memory = MemoryManager()
+    def __init__(self, memory=None):
+        self.memory = memory or MemoryManager()
 
     def interpret(self, equation_result, facts):
         """Explain symbolic result using current context and memory."""
         # Retrieve related past insights
-        related = self.memory.search_memory("cosmology expansion universe")
+        related = self.memory.search_memory("cosmology expansion universe", limit=3, recency_half_life=30)
 
         past_context = ""
         if related:
@@ -0,0 +1,59 @@
+# src/compiled_eval.py
+# Compiled, array-speed evaluation of symbolic expressions (SymPy lambdify / numexpr).
+
+import json
+from functools import lru_cache
+
+import numpy as np
+import sympy as sp
+
+from instrumentation import traced
+from sympy_conversion import sympy_locals
+
+try:
+    import numexpr  # noqa: F401  (optional backend, used through lambdify)
+    HAS_NUMEXPR = True
+except ImportError:
+    HAS_NUMEXPR = False
+
+DEFAULT_VARIABLES = ("rho", "Lambda")
+
+
+@lru_cache(maxsize=512)
+@traced("sympy.compile")  # under the cache: only misses are recorded
+def compile_expression(expr_str, variables=DEFAULT_VARIABLES, backend="numpy"):
+    """Compile `expr_str` into a vectorised function of `variables`.
+
+    `expr_str` may be SymPy syntax or a DEAP string such as "mul(rho, exp(1.5))".
+
+    backend: "numpy" (lambdify to NumPy) or "numexpr" (requires numexpr).
+    Compiled functions are cached per (expression, variables, backend), so
+    repeated calls with the same string cost a dictionary lookup.
+    """
+    if backend not in ("numpy", "numexpr"):
+        raise ValueError(f"Unknown backend: {backend!r}")
+    if backend == "numexpr" and not HAS_NUMEXPR:
+        raise ImportError("The numexpr backend requires the numexpr package")
+
+    names = sympy_locals(variables)
+    expr = sp.sympify(expr_str, locals=names)
+    return sp.lambdify([names[v] for v in variables], expr, modules=backend)
+
+
+def evaluate_expression(expr_str, backend="numpy", **values):
+    """Evaluate `expr_str` with keyword arrays/scalars, e.g. rho=..., Lambda=...
+
+    The result is broadcast to the common shape of the inputs, so constant
+    expressions still return one value per grid point.
+    """
+    func = compile_expression(expr_str, tuple(values), backend)
+    arrays = [np.asarray(v, dtype=float) for v in values.values()]
+    result = func(*arrays)
+    return np.broadcast_to(result, np.broadcast(*arrays).shape) if arrays else result
+
+
+def load_discovered_law(path="data/simplified_expression.json", variables=DEFAULT_VARIABLES, backend="numpy"):
+    """Compiled function of the simplified expression saved by symbolic_simplifier."""
+    with open(path, "r", encoding="utf-8") as f:
+        expr_str = json.load(f)["simplified_expression"]
+    return compile_expression(expr_str, tuple(variables), backend)
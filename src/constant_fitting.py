@@ -0,0 +1,106 @@
+# src/constant_fitting.py
+# Least-squares tuning of the numeric constants inside GP trees.
+
+import copy
+
+import numpy as np
+from scipy.optimize import least_squares
+
+from population_evaluator import evaluate_population, evaluate_tree
+
+
+def constant_positions(individual):
+    """Indices of numeric constant nodes (argument terminals hold their name as a str)."""
+    return [i for i, node in enumerate(individual) if node.arity == 0 and not isinstance(node.value, str)]
+
+
+def structure_key(individual, positions):
+    """Prefix node names with every constant replaced by a placeholder."""
+    skip = set(positions)
+    return tuple("#" if i in skip else node.name for i, node in enumerate(individual))
+
+
+def with_constants(individual, positions, values):
+    """Node list of `individual` with the constants at `positions` set to `values`."""
+    tree = list(individual)
+    for pos, value in zip(positions, values):
+        node = copy.copy(tree[pos])
+        node.value = float(value)
+        tree[pos] = node
+    return tree
+
+
+class ConstantFitter:
+    """Tunes the constants of the best individuals of a generation against y.
+
+    Residuals are computed on whole arrays with evaluate_tree and minimised
+    with scipy's least_squares. Fitted constants are cached per tree structure,
+    so each structure is optimised once and later copies reuse the result.
+    """
+
+    def __init__(self, pset, X, y, top_k=5, max_nfev=50, max_cache=10_000):
+        self.pset = pset
+        self.X = X
+        self.y = y
+        self.top_k = top_k
+        self.max_nfev = max_nfev
+        self.max_cache = max_cache
+        self.fitted = {}
+        self.tuned = 0
+
+    def _fit(self, individual, positions, X, y):
+        columns = {name: np.ascontiguousarray(X[:, i]) for i, name in enumerate(self.pset.arguments)}
+
+        def residuals(values):
+            tree = with_constants(individual, positions, values)
+            with np.errstate(all="ignore"):
+                y_pred = np.asarray(evaluate_tree(tree, self.pset, columns), dtype=float)
+            r = np.broadcast_to(y_pred, y.shape) - y
+            return np.nan_to_num(r, nan=1e12, posinf=1e12, neginf=-1e12)
+
+        x0 = np.array([individual[pos].value for pos in positions], dtype=float)
+        try:
+            return least_squares(residuals, x0, max_nfev=self.max_nfev).x
+        except (ValueError, FloatingPointError):
+            return x0
+
+    def tune(self, population, rows=None):
+        """Tune the top_k individuals in place; return how many improved.
+
+        rows: the mini-batch the population was scored on, if any; fitting and
+        the comparison with the current fitness then use the same rows.
+        """
+        X, y = (self.X, self.y) if rows is None else (self.X[rows], self.y[rows])
+        improved = 0
+        ranked = sorted(population, key=lambda ind: ind.fitness, reverse=True)[:self.top_k]
+        for ind in ranked:
+            positions = constant_positions(ind)
+            if not positions:
+                continue
+            key = structure_key(ind, positions)
+            values = self.fitted.get(key)
+            if values is None:
+                values = self._fit(ind, positions, X, y)
+                if len(self.fitted) < self.max_cache:
+                    self.fitted[key] = values
+
+            candidate = with_constants(ind, positions, values)
+            rmse = evaluate_population([candidate], self.pset, X, y)[0]
+            if rmse < ind.fitness.values[0]:
+                for pos in positions:
+                    ind[pos] = candidate[pos]
+                ind.fitness.values = (rmse,)
+                improved += 1
+        self.tuned += improved
+        return improved
+
+    def take_count(self):
+        """Return the number of improved individuals since the last call and reset it."""
+        count, self.tuned = self.tuned, 0
+        return count
+
+    def snapshot(self):
+        return dict(self.fitted)
+
+    def restore(self, snapshot):
+        self.fitted = dict(snapshot)
@@ -1,39 +1,165 @@
+import json
+import os
+
 import pandas as pd
 import numpy as np
 from astropy.cosmology import FlatLambdaCDM
 from astropy import constants as const
 
-# Define cosmological model
-cosmo = FlatLambdaCDM(H0=70, Om0=0.3)
-
-# Generate synthetic redshift dataset
-z_values = np.linspace(0.01, 5, 50)
-distance = cosmo.comoving_distance(z_values).value  # in Mpc
-luminosity_distance = cosmo.luminosity_distance(z_values).value  # in Mpc
-age = cosmo.age(z_values).value  # in Gyr
-
-# Create dataframe
-df = pd.DataFrame({
-    "redshift_z": z_values,
-    "comoving_distance_Mpc": distance,
-    "luminosity_distance_Mpc": luminosity_distance,
-    "universe_age_Gyr": age
-})
-
-# Add universal constants
-constants_data = {
-    "G_gravitational": const.G.value,
-    "c_speed_of_light": const.c.value,
-    "H0_current": cosmo.H0.value,
-    "Omega_matter": cosmo.Om0,
-    "Omega_lambda": cosmo.Ode0
-}
-
-# Save files
-df.to_csv("data/processed/cosmology_data.csv", index=False)
-pd.DataFrame([constants_data]).to_csv("data/processed/constants.csv", index=False)
-
-print("\n✅ Data preprocessing complete.")
-print("Saved files:")
-print("→ data/processed/cosmology_data.csv")
-print("→ data/processed/constants.csv")
+NOISE_MODELS = ("none", "gaussian", "absolute")
+
+
+# -------------------------
+# 1) Reference CSV dataset
+# -------------------------
+def write_reference_csv(out_dir="data/processed", H0=70, Om0=0.3, n_redshifts=50):
+    """Small CSV dataset with distances and ages, plus constants.csv."""
+    # Define cosmological model
+    cosmo = FlatLambdaCDM(H0=H0, Om0=Om0)
+
+    # Generate synthetic redshift dataset
+    z_values = np.linspace(0.01, 5, n_redshifts)
+    distance = cosmo.comoving_distance(z_values).value  # in Mpc
+    luminosity_distance = cosmo.luminosity_distance(z_values).value  # in Mpc
+    age = cosmo.age(z_values).value  # in Gyr
+
+    # Create dataframe
+    df = pd.DataFrame({
+        "redshift_z": z_values,
+        "comoving_distance_Mpc": distance,
+        "luminosity_distance_Mpc": luminosity_distance,
+        "universe_age_Gyr": age
+    })
+
+    # Add universal constants
+    constants_data = {
+        "G_gravitational": const.G.value,
+        "c_speed_of_light": const.c.value,
+        "H0_current": cosmo.H0.value,
+        "Omega_matter": cosmo.Om0,
+        "Omega_lambda": cosmo.Ode0
+    }
+
+    # Save files
+    os.makedirs(out_dir, exist_ok=True)
+    df.to_csv(os.path.join(out_dir, "cosmology_data.csv"), index=False)
+    pd.DataFrame([constants_data]).to_csv(os.path.join(out_dir, "constants.csv"), index=False)
+
+
+# -------------------------
+# 2) Large columnar datasets
+# -------------------------
+def _redshift_grid(j, n_redshifts, z_min, z_max):
+    """Elements j of np.linspace(z_min, z_max, n_redshifts), without building the grid."""
+    if n_redshifts == 1:
+        return np.full(j.shape, float(z_min))
+    step = (z_max - z_min) / (n_redshifts - 1)
+    z = j * step + z_min
+    z[j == n_redshifts - 1] = z_max
+    return z
+
+
+def generate_synthetic_dataset(out_dir, n_redshifts=50, z_min=0.01, z_max=5.0,
+                               H0_values=(70.0,), Om0_values=(0.3,),
+                               noise="none", noise_level=0.0,
+                               chunk_rows=1_000_000, seed=42):
+    """Write a redshift grid for every (H0, Om0) pair as columnar .npy files.
+
+    Rows are generated and written `chunk_rows` at a time into memory-mapped
+    files, so the dataset never has to fit in RAM. H(z) uses the closed-form
+    flat LambdaCDM expression (no radiation), evaluated per row.
+
+    noise: "none", "gaussian" (relative, sigma = noise_level) or "absolute"
+    (additive, sigma = noise_level, in H^2 units); applied to the H2 target.
+
+    Om0 enters both features, so several Om0 values can share one dataset.
+    H0 only scales the target and is not a feature, so rows for different H0
+    values would disagree; H0_values must therefore hold a single value.
+
+    Output files in `out_dir`:
+      features.npy      (n, 2) Fortran-ordered [rho_proxy, Lambda_proxy]
+      H2.npy            target H(z)^2
+      redshift_z.npy, H0.npy, Omega_matter.npy, Omega_lambda.npy
+      manifest.json     parameters and row count, written last
+    """
+    if noise not in NOISE_MODELS:
+        raise ValueError(f"Unknown noise model: {noise!r} (expected one of {NOISE_MODELS})")
+    if len({float(H0) for H0 in H0_values}) != 1:
+        raise ValueError(f"Expected exactly one H0 value, got {tuple(H0_values)}: "
+                         "H0 is not a feature, so a sweep gives the same features different targets")
+
+    cosmologies = [(float(H0), float(Om0)) for H0 in H0_values for Om0 in Om0_values]
+    n_rows = len(cosmologies) * n_redshifts
+    os.makedirs(out_dir, exist_ok=True)
+
+    def column(name, shape=(n_rows,), fortran_order=False):
+        return np.lib.format.open_memmap(os.path.join(out_dir, f"{name}.npy"), mode="w+",
+                                         dtype=np.float64, shape=shape, fortran_order=fortran_order)
+
+    features = column("features", (n_rows, 2), fortran_order=True)
+    columns = {name: column(name) for name in ("H2", "redshift_z", "H0", "Omega_matter", "Omega_lambda")}
+    cosmo_H0 = np.array([c[0] for c in cosmologies])
+    cosmo_Om0 = np.array([c[1] for c in cosmologies])
+    rng = np.random.default_rng(seed)
+
+    for start in range(0, n_rows, chunk_rows):
+        rows = np.arange(start, min(start + chunk_rows, n_rows))
+        c, j = np.divmod(rows, n_redshifts)
+        z = _redshift_grid(j, n_redshifts, z_min, z_max)
+        H0, Om0 = cosmo_H0[c], cosmo_Om0[c]
+        Ode0 = 1.0 - Om0
+
+        rho_proxy = Om0 * (1 + z) ** 3
+        H2 = H0 ** 2 * (rho_proxy + Ode0)
+        if noise == "gaussian":
+            H2 *= 1 + noise_level * rng.standard_normal(len(rows))
+        elif noise == "absolute":
+            H2 += noise_level * rng.standard_normal(len(rows))
+
+        chunk = slice(rows[0], rows[-1] + 1)
+        features[chunk, 0] = rho_proxy
+        features[chunk, 1] = Ode0
+        columns["H2"][chunk] = H2
+        columns["redshift_z"][chunk] = z
+        columns["H0"][chunk] = H0
+        columns["Omega_matter"][chunk] = Om0
+        columns["Omega_lambda"][chunk] = Ode0
+
+    for array in [features, *columns.values()]:
+        array.flush()
+    del features, columns
+
+    manifest = {
+        "rows": n_rows,
+        "n_redshifts": n_redshifts,
+        "z_range": [z_min, z_max],
+        "cosmologies": cosmologies,
+        "noise": noise,
+        "noise_level": noise_level,
+        "seed": seed,
+        "features": ["rho_proxy", "Lambda_proxy"],
+        "target": "H2",
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_columnar_dataset(path):
+    """Memory-map a dataset written by generate_synthetic_dataset; returns X, y, z."""
+    if not os.path.exists(os.path.join(path, "manifest.json")):
+        raise FileNotFoundError(f"No manifest.json in {path}; dataset is missing or incomplete")
+
+    def load(name):
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+    return load("features"), load("H2"), load("redshift_z")
+
+
+if __name__ == "__main__":
+    write_reference_csv()
+
+    print("\n✅ Data preprocessing complete.")
+    print("Saved files:")
+    print("→ data/processed/cosmology_data.csv")
+    print("→ data/processed/constants.csv")
@@ -0,0 +1,36 @@
+# src/embedding_registry.py
+# Process-wide registry of sentence-transformer models, loaded on first use and shared by every caller.
+
+import threading
+from functools import partial
+
+from instrumentation import span
+
+DEFAULT_MODEL = "all-MiniLM-L6-v2"
+
+_models = {}
+_lock = threading.Lock()
+
+
+def get_model(model_name=DEFAULT_MODEL):
+    """The shared SentenceTransformer for `model_name`, loaded on the first call."""
+    model = _models.get(model_name)
+    if model is None:
+        with _lock:
+            model = _models.get(model_name)
+            if model is None:
+                with span("embedding.load_model", model=model_name):
+                    from sentence_transformers import SentenceTransformer
+                    model = _models[model_name] = SentenceTransformer(model_name)
+    return model
+
+
+def embed(texts, model_name=DEFAULT_MODEL, batch_size=64):
+    """(len(texts), dim) NumPy array of embeddings from the shared model."""
+    return get_model(model_name).encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+
+
+def embedder(model_name=DEFAULT_MODEL):
+    """texts -> vectors function; the model is only loaded when it is first called."""
+    return partial(embed, model_name=model_name)
+
@@ -0,0 +1,232 @@
+# src/instrumentation.py
+# Opt-in spans recording wall time, CPU time and memory delta, exported as JSONL.
+
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+TRACE_ENV = "COSMOSYM_TRACE"
+MAX_RECORDS = 100_000  # spans kept in memory when not writing to a file
+
+_enabled = False
+_path = None
+_records = deque(maxlen=MAX_RECORDS)
+_lock = threading.Lock()
+_file = None
+_file_pid = None
+_current = contextvars.ContextVar("current_span", default=None)
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = None
+
+
+def _rss_bytes():
+    """Resident set size of this process (0 where /proc is unavailable)."""
+    if _PAGE_SIZE is None:
+        return 0
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+# -------------------------
+# 1) Switching it on
+# -------------------------
+def enable(path=None):
+    """Start recording spans.
+
+    With `path` each span is appended to that JSONL file and not kept in
+    memory; without it the latest MAX_RECORDS spans are kept for records().
+
+    Setting COSMOSYM_TRACE=<path> in the environment does the same at import,
+    which also covers worker processes started by the pipeline.
+    """
+    global _enabled, _path
+    _path = path
+    _enabled = True
+
+
+def disable():
+    global _enabled, _file
+    _enabled = False
+    with _lock:
+        if _file is not None:
+            _file.close()
+            _file = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def records():
+    """Spans kept in memory by this process (oldest first); empty when writing to a file."""
+    with _lock:
+        return list(_records)
+
+
+def clear():
+    with _lock:
+        _records.clear()
+
+
+def _emit(record):
+    global _file, _file_pid
+    with _lock:
+        if _path is None:
+            _records.append(record)
+            return
+        # One line per write on an O_APPEND file: forked workers can share the trace
+        if _file is None or _file_pid != os.getpid():
+            _file = open(_path, "a", encoding="utf-8")
+            _file_pid = os.getpid()
+        _file.write(json.dumps(record, default=str) + "\n")
+        _file.flush()
+
+
+# -------------------------
+# 2) Spans
+# -------------------------
+class _Span:
+    __slots__ = ("name", "attrs", "parent", "token", "start", "wall", "cpu", "rss")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.parent = _current.get()
+        self.token = _current.set(self.name)
+        self.start = time.time()
+        self.rss = _rss_bytes()
+        self.cpu = time.thread_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        _current.reset(self.token)
+        _emit({
+            "name": self.name,
+            "parent": self.parent,
+            "start": self.start,
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "mem_delta_bytes": _rss_bytes() - self.rss,
+            "pid": os.getpid(),
+            "thread": threading.get_ident(),
+            "error": None if exc_type is None else exc_type.__name__,
+            **self.attrs,
+        })
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **attrs):
+    """Context manager timing its body as `name`; a shared no-op while disabled.
+
+    cpu_s is CPU time of the calling thread (work handed to other processes
+    shows up as wall time only); mem_delta_bytes is the change in the
+    process RSS. Extra keyword arguments are stored with the record.
+    """
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(name, attrs)
+
+
+def traced(name=None):
+    """Decorator recording every call of the function as a span."""
+    def decorate(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# -------------------------
+# 3) Reports
+# -------------------------
+def load_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    pos = (len(sorted_values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(spans):
+    """{name: stats} with count, total and p50/p90/p99/max wall time, mean CPU time and memory delta."""
+    groups = {}
+    for record in spans:
+        groups.setdefault(record["name"], []).append(record)
+    summary = {}
+    for name, group in groups.items():
+        walls = sorted(r["wall_s"] for r in group)
+        summary[name] = {
+            "count": len(group),
+            "total_s": sum(walls),
+            "p50_s": _percentile(walls, 0.50),
+            "p90_s": _percentile(walls, 0.90),
+            "p99_s": _percentile(walls, 0.99),
+            "max_s": walls[-1],
+            "cpu_mean_s": sum(r["cpu_s"] for r in group) / len(group),
+            "mem_mean_kb": sum(r["mem_delta_bytes"] for r in group) / len(group) / 1024,
+        }
+    return summary
+
+
+def format_summary(spans):
+    """Text table of summarize(spans), slowest total first, times in ms."""
+    summary = summarize(spans)
+    header = f"{'span':<32} {'count':>7} {'total':>10} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9} {'cpu':>9} {'mem KB':>9}"
+    lines = [header, "-" * len(header)]
+    for name, s in sorted(summary.items(), key=lambda item: item[1]["total_s"], reverse=True):
+        lines.append(
+            f"{name[:32]:<32} {s['count']:>7} {s['total_s'] * 1e3:>10.1f} {s['p50_s'] * 1e3:>9.2f} "
+            f"{s['p90_s'] * 1e3:>9.2f} {s['p99_s'] * 1e3:>9.2f} {s['max_s'] * 1e3:>9.2f} "
+            f"{s['cpu_mean_s'] * 1e3:>9.2f} {s['mem_mean_kb']:>9.1f}"
+        )
+    return "\n".join(lines)
+
+
+if os.environ.get(TRACE_ENV):
+    enable(os.environ[TRACE_ENV])
+
+
+if __name__ == "__main__":
+    # Summary of a trace: python src/instrumentation.py trace.jsonl
+    print(format_summary(load_records(sys.argv[1] if len(sys.argv) > 1 else "data/trace.jsonl")))
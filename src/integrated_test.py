@@ -1,8 +1,8 @@
 import sympy as sp
 import pandas as pd
 from astropy.cosmology import FlatLambdaCDM
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_community.vectorstores import FAISS
+
+from knowledge_retriever import KnowledgeBase, default_corpus
 
 # ----------------------------
 # 1️⃣ Symbolic setup
@@ -35,15 +35,18 @@ print(f"\n🌌 Example: Comoving distance at z={z_sample}: {dist:.2f} Mpc")
 # ----------------------------
 # 3️⃣ Retrieve cosmological context (RAG)
 # ----------------------------
-embedding = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-retriever = FAISS.load_local("data/processed/vector_index", embedding, allow_dangerous_deserialization=True)
+knowledge_base = KnowledgeBase()
+if not len(knowledge_base):
+    # First run: build the index from the built-in corpus
+    knowledge_base.sync(default_corpus())
+    knowledge_base.save()
 
 query = "What is the cosmological constant and its role in the Friedmann equation?"
-results = retriever.similarity_search(query, k=2)
+results = knowledge_base.search(query, k=2)
 
 print("\n🔎 Knowledge Retrieval Results:")
-for i, r in enumerate(results, 1):
-    print(f"{i}. {r.page_content}")
+for i, (_, text, _) in enumerate(results, 1):
+    print(f"{i}. {text}")
 
 # ----------------------------
 # 4️⃣ Combine symbolic + numeric context
@@ -1,49 +1,25 @@
-import os
 import json
-import subprocess
 from datetime import datetime
-from insight_agent import InsightAgent
+from pipeline_service import PipelineService
 
 
-def run_stage(command, title):
-    print(f"\n⚙️  Running {title}...")
-    result = subprocess.run(command, shell=True, capture_output=True, text=True)
-    print(result.stdout)
-    if result.stderr:
-        print("⚠️", result.stderr)
-    print(f"✅ {title} done.\n")
-
-def load_json(path):
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return None
-
 def main():
     print("🌌 Welcome to COSMOSYM Interactive Mode 🌌")
     print("Ask any cosmic or physics-based question below.\n")
 
+    # Stages run in-process; models and the GP result are reused across questions
+    service = PipelineService()
+
     while True:
         query = input("🔭 Enter your research question (or type 'exit' to quit): ").strip()
         if query.lower() == "exit":
             print("\n🪐 Exiting COSMOSYM. See you in the next universe!")
             break
 
-        # Step 1️⃣ Run agent_graph
-        run_stage("python src/agent_graph.py", "Knowledge Graph Builder")
-
-        # Step 2️⃣ Run symbolic_engine
-        run_stage("python src/symbolic_engine.py", "Symbolic Regression Engine")
-
-        # Step 3️⃣ Run symbolic_simplifier
-        run_stage("python src/symbolic_simplifier.py", "Symbolic Simplifier")
-
-        # Step 4️⃣ Run insight generation
-        simplified_data = load_json("data/simplified_expression.json")
-        simplified_expr = simplified_data.get("simplified_expression") if simplified_data else None
-
-        insight_agent = InsightAgent()
-        insight = insight_agent.generate_insight(query, simplified_expr or "unknown_equation", [], "")
+        # Steps 1️⃣-4️⃣ agent graph, symbolic regression, simplification, insight
+        result = service.answer(query)
+        simplified_expr = result["equation"]
+        insight = result["insight"]
 
         # Save results
         output = {
@@ -1,38 +1,167 @@
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.docstore.document import Document
+# src/knowledge_retriever.py
+# Persistent cosmology knowledge base: documents are embedded once and updated incrementally.
+
+import json
+import os
+import time
+
 import pandas as pd
 
-# Load processed data
-constants = pd.read_csv("data/processed/constants.csv").to_dict(orient="records")[0]
+from vector_index import VectorIndex, _atomic_write, content_hash
+
+KNOWLEDGE_INDEX_PATH = "data/processed/knowledge_index"
+
+
+class KnowledgeBase:
+    """Semantic search over documents identified by string ids.
+
+    add_documents embeds only documents that are new or whose text changed
+    (embeddings are cached by content hash); remove_documents drops them from
+    the index and the cache. Nothing is ever rebuilt. save() writes the documents to a new
+    documents-*.jsonl, then the FAISS index and a manifest naming both, so a
+    crash leaves the previous save intact. The index is memory-mapped on load
+    (mmap=True) and only copied into memory when the corpus is modified.
+    """
+
+    def __init__(self, path=KNOWLEDGE_INDEX_PATH, embed_fn=None, mmap=True):
+        if embed_fn is None:
+            from embedding_registry import embedder
+            embed_fn = embedder()  # the model loads on the first document actually embedded
+        self.path = path
+        self.index = VectorIndex(path, embed_fn, mmap=mmap)
+        self.documents = {}  # doc id -> {"vector_id", "hash", "text"}
+        self.next_id = self.index.meta.get("next_id", 0)
+        self.dirty = False
+
+        docs_file = self.index.meta.get("documents_file")
+        if docs_file:
+            with open(os.path.join(path, docs_file), "r", encoding="utf-8") as f:
+                for line in f:
+                    doc = json.loads(line)
+                    self.documents[doc.pop("id")] = doc
+        self.by_vector_id = {doc["vector_id"]: doc_id for doc_id, doc in self.documents.items()}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.documents
+
+    # -----------------------------------------
+    def add_documents(self, documents):
+        """Insert or update documents given as {id: text} or (id, text) pairs.
+
+        Returns (added, updated); unchanged documents cost a hash lookup.
+        """
+        documents = dict(documents)  # a repeated id keeps its last text
+        new_ids, new_texts, stale, old_hashes = [], [], [], []
+        added = updated = 0
+        for doc_id, text in documents.items():
+            digest = content_hash(text)
+            current = self.documents.get(doc_id)
+            if current is not None:
+                if current["hash"] == digest:
+                    continue
+                stale.append(current["vector_id"])
+                old_hashes.append(current["hash"])
+                del self.by_vector_id[current["vector_id"]]
+                updated += 1
+            else:
+                added += 1
+            self.documents[doc_id] = {"vector_id": self.next_id, "hash": digest, "text": text}
+            self.by_vector_id[self.next_id] = doc_id
+            new_ids.append(self.next_id)
+            new_texts.append(text)
+            self.next_id += 1
+
+        self.index.remove(stale)
+        self.index.add(new_ids, new_texts)
+        self._forget(old_hashes)
+        self.dirty = self.dirty or bool(new_ids)
+        return added, updated
+
+    def remove_documents(self, doc_ids):
+        """Drop documents by id (unknown ids are ignored); returns how many were removed."""
+        stale, old_hashes = [], []
+        for doc_id in doc_ids:
+            doc = self.documents.pop(doc_id, None)
+            if doc is not None:
+                stale.append(doc["vector_id"])
+                old_hashes.append(doc["hash"])
+                del self.by_vector_id[doc["vector_id"]]
+        self.index.remove(stale)
+        self._forget(old_hashes)
+        self.dirty = self.dirty or bool(stale)
+        return len(stale)
+
+    def _forget(self, hashes):
+        """Drop cached embeddings of texts that no remaining document uses."""
+        if not hashes:
+            return
+        live = {doc["hash"] for doc in self.documents.values()}
+        self.index.cache.discard(h for h in set(hashes) if h not in live)
+
+    def sync(self, documents):
+        """Make the corpus exactly `documents` ({id: text}); returns (added, updated, removed)."""
+        added, updated = self.add_documents(documents)
+        removed = self.remove_documents([doc_id for doc_id in list(self.documents) if doc_id not in documents])
+        return added, updated, removed
+
+    # -----------------------------------------
+    def search(self, query, k=5):
+        """[(doc id, text, cosine similarity)] of the k closest documents, best first."""
+        results = []
+        for vector_id, score in self.index.search(query, k):
+            doc_id = self.by_vector_id.get(vector_id)
+            if doc_id is not None:
+                results.append((doc_id, self.documents[doc_id]["text"], score))
+        return results
+
+    def save(self):
+        """Atomically persist documents, index and embedding cache (no-op when unchanged)."""
+        if not self.dirty:
+            self.index.cache.save()
+            return
+        os.makedirs(self.path, exist_ok=True)
+        docs_file = f"documents-{time.time_ns()}-{os.getpid()}.jsonl"
+        lines = "".join(json.dumps(dict(doc, id=doc_id), ensure_ascii=False) + "\n"
+                        for doc_id, doc in self.documents.items())
+        _atomic_write(os.path.join(self.path, docs_file), lambda f: f.write(lines.encode("utf-8")))
+
+        self.index.save(documents_file=docs_file, next_id=self.next_id, n_docs=len(self.documents))
+        for name in os.listdir(self.path):
+            if name.startswith("documents-") and name.endswith(".jsonl") and name != docs_file:
+                os.remove(os.path.join(self.path, name))
+        self.dirty = False
 
-# Example cosmological text corpus
-texts = [
-    "The Friedmann equations describe the expansion of the universe in general relativity.",
-    "The Hubble constant defines the rate of expansion of the universe.",
-    "The cosmological constant (Λ) represents dark energy density in Einstein's field equations.",
-    f"The current value of the Hubble constant is approximately {constants['H0_current']} km/s/Mpc.",
-    "Dark matter constitutes approximately 27% of the total mass-energy of the universe.",
-    "The speed of light is constant at approximately 3 × 10^8 m/s.",
-]
 
-# Create Document objects for each text
-docs = [Document(page_content=t) for t in texts]
+# -----------------------------------------
+# Built-in corpus
+# -----------------------------------------
+def default_corpus(constants_path="data/processed/constants.csv"):
+    constants = pd.read_csv(constants_path).to_dict(orient="records")[0]
+    return {
+        "friedmann_equations": "The Friedmann equations describe the expansion of the universe in general relativity.",
+        "hubble_constant": "The Hubble constant defines the rate of expansion of the universe.",
+        "cosmological_constant": "The cosmological constant (Λ) represents dark energy density in Einstein's field equations.",
+        "hubble_constant_value": f"The current value of the Hubble constant is approximately {constants['H0_current']} km/s/Mpc.",
+        "dark_matter_fraction": "Dark matter constitutes approximately 27% of the total mass-energy of the universe.",
+        "speed_of_light": "The speed of light is constant at approximately 3 × 10^8 m/s.",
+    }
 
-# Create embeddings & vector store
-embedding = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-vectorstore = FAISS.from_documents(docs, embedding)
 
-# Save vector index
-vectorstore.save_local("data/processed/vector_index")
+if __name__ == "__main__":
+    kb = KnowledgeBase()
+    added, updated, removed = kb.sync(default_corpus())
+    kb.save()
 
-print("\n✅ Knowledge base created and saved to data/processed/vector_index")
+    print(f"\n✅ Knowledge base saved to {kb.path}: {len(kb)} documents "
+          f"({added} added, {updated} updated, {removed} removed)")
 
-# Test retrieval
-query = "What defines the rate of expansion of the universe?"
-retriever = FAISS.load_local("data/processed/vector_index", embedding, allow_dangerous_deserialization=True)
-results = retriever.similarity_search(query, k=2)
+    # Test retrieval
+    query = "What defines the rate of expansion of the universe?"
+    results = kb.search(query, k=2)
 
-print("\n🔎 Query:", query)
-for i, r in enumerate(results, 1):
-    print(f"Result {i}: {r.page_content}")
+    print("\n🔎 Query:", query)
+    for i, (_, text, _) in enumerate(results, 1):
+        print(f"Result {i}: {text}")
@@ -0,0 +1,96 @@
+# src/memory_index.py
+# Incremental inverted index with BM25 ranking for memory entries.
+
+import math
+import os
+import pickle
+import re
+from collections import Counter, defaultdict
+
+TOKEN_RE = re.compile(r"\w+")
+INDEX_VERSION = 1
+
+
+def tokenize(text):
+    """Lowercased word tokens (Unicode-aware, so ρ and Λ are kept)."""
+    return TOKEN_RE.findall(text.lower())
+
+
+class KeywordIndex:
+    """Inverted index (term -> {doc id: term frequency}) ranked with BM25.
+
+    Documents are numbered in the order they are added, which for the memory
+    store is the entry's position, so adding is O(tokens) and queries only
+    touch the postings of their own terms.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.doc_len = []
+        self.total_len = 0
+
+    @property
+    def n_docs(self):
+        return len(self.doc_len)
+
+    def add(self, text):
+        doc_id = len(self.doc_len)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings[term][doc_id] = tf
+        length = sum(counts.values())
+        self.doc_len.append(length)
+        self.total_len += length
+        return doc_id
+
+    def scores(self, query):
+        """BM25 score of every document that contains at least one query term."""
+        n = self.n_docs
+        if n == 0:
+            return {}
+        avg_len = self.total_len / n or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log((n - len(docs) + 0.5) / (len(docs) + 0.5) + 1)
+            for doc_id, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    # -----------------------------------------
+    def save(self, path, **meta):
+        """Atomically write the index with `meta` (e.g. what it was built from)."""
+        state = {
+            "version": INDEX_VERSION,
+            "meta": meta,
+            "k1": self.k1,
+            "b": self.b,
+            "postings": dict(self.postings),
+            "doc_len": self.doc_len,
+            "total_len": self.total_len,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Return (index, meta), or (None, None) if missing or unreadable."""
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None, None
+        if state.get("version") != INDEX_VERSION:
+            return None, None
+        index = cls(state["k1"], state["b"])
+        index.postings = defaultdict(dict, state["postings"])
+        index.doc_len = state["doc_len"]
+        index.total_len = state["total_len"]
+        return index, state["meta"]
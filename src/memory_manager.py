@@ -2,56 +2,504 @@
 # memory_manager.py — Handles short-term and long-term storage
 # ============================================================
 
+import atexit
+import hashlib
 import json
 import os
+import sys
+import threading
 from datetime import datetime
 
+from instrumentation import traced
+from memory_index import KeywordIndex
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are not locked across processes
+    fcntl = None
+
+INDEX_SAVE_EVERY = 1000  # new entries indexed before the snapshot is rewritten
+EMBED_BATCH_SIZE = 64
+
+
+def _entry_text(entry):
+    return f"{entry.get('query', '')} {entry.get('explanation', '')}"
+
+
+def _entry_time(entry):
+    try:
+        return datetime.fromisoformat(entry["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _default_embed_fn():
+    from embedding_registry import embedder
+    return embedder()
+
+
+# -----------------------------------------
+# Append-only JSONL store
+# -----------------------------------------
+class _MemoryStore:
+    """Entries of one JSONL file, shared by every MemoryManager on that path.
+
+    Each entry is one line. Appends take an exclusive lock on the file, read
+    whatever other processes appended since our last read, then write the new
+    line, so writes cost O(1) and concurrent writers never interleave. When
+    the file is replaced (see compact_memory) everything is read again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.offset = 0
+        self.inode = None
+        self.lock = threading.RLock()
+        self.index_path = os.path.splitext(path)[0] + ".index.pkl"
+        self.keyword_index = None
+        self.unsaved = 0
+        self.vector_path = os.path.splitext(path)[0] + ".vectors"
+        self.vector_index = None
+        self.vector_docs = 0
+        self.vector_unsaved = 0
+
+    def _reset(self, inode):
+        """Forget everything read from a file that has since been replaced."""
+        self.entries = []
+        self.offset = 0
+        self.inode = inode
+        self.keyword_index = None
+        self.unsaved = 0
+        self.vector_index = None
+        self.vector_docs = 0
+        self.vector_unsaved = 0
+
+    def _read_tail(self):
+        """Parse complete lines after self.offset (caller holds self.lock)."""
+        with open(self.path, "rb") as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if inode != self.inode:
+                self._reset(inode)
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # a line still being written is left for later
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self.entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # torn line from an interrupted writer
+        self.offset += end
+        self._update_index()
+        return len(data) > end
+
+    def refresh(self):
+        """Pick up entries appended since the last read, if the file grew or was replaced."""
+        with self.lock:
+            if not os.path.exists(self.path):
+                return
+            stat = os.stat(self.path)
+            if stat.st_ino != self.inode or stat.st_size > self.offset:
+                self._read_tail()
+
+    def append(self, entry):
+        self.append_many([entry])
+
+    def append_many(self, entries):
+        """Append entries with a single locked write."""
+        if not entries:
+            return
+        line = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+        with self.lock:
+            while True:
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                if os.fstat(fd).st_ino == os.stat(self.path).st_ino:
+                    break
+                os.close(fd)  # a compaction swapped the file while we waited for the lock
+            try:
+                if self._read_tail():
+                    line = b"\n" + line  # keep a torn last line from swallowing ours
+                os.write(fd, line)
+                self.entries.extend(entries)
+                self.offset = os.fstat(fd).st_size
+            finally:
+                os.close(fd)  # also releases the flock
+            self._update_index()
+
+    # -----------------------------------------
+    def _update_index(self):
+        """Index entries added since the last call (caller holds self.lock).
+
+        New entries are embedded once a full batch of them is pending.
+        """
+        if self.keyword_index is not None:
+            for entry in self.entries[self.keyword_index.n_docs:]:
+                self.keyword_index.add(_entry_text(entry))
+                self.unsaved += 1
+            if self.unsaved >= INDEX_SAVE_EVERY:
+                self.save_index()
+        if self.vector_index is not None and len(self.entries) - self.vector_docs >= EMBED_BATCH_SIZE:
+            self._embed_pending()
+
+    def _embed_pending(self):
+        pending = self.entries[self.vector_docs:]
+        if not pending:
+            return
+        ids = range(self.vector_docs, len(self.entries))
+        self.vector_index.add(ids, [_entry_text(entry) for entry in pending])
+        self.vector_docs = len(self.entries)
+        self.vector_unsaved += len(pending)
+        if self.vector_unsaved >= INDEX_SAVE_EVERY:
+            self.save_vectors()
+
+    def _load_keyword_index(self):
+        index, meta = KeywordIndex.load(self.index_path)
+        # The snapshot only counts if it was built from this very file
+        if index is None or meta.get("inode") != self._inode() or meta.get("n_docs", 0) > len(self.entries):
+            index = KeywordIndex()
+        self.keyword_index = index
+        atexit.register(self.save_index)
+        self._update_index()
+
+    def keyword_scores(self, query):
+        """BM25 scores by entry position; the index is loaded or built on first use."""
+        with self.lock:
+            if self.keyword_index is None:
+                self._load_keyword_index()
+            return self.keyword_index.scores(query)
+
+    def save_index(self):
+        """Persist the keyword index next to the store, with what it covers."""
+        with self.lock:
+            if self.keyword_index is None or not self.unsaved or not os.path.exists(self.path):
+                return
+            self.keyword_index.save(self.index_path, inode=self._inode(), n_docs=self.keyword_index.n_docs)
+            self.unsaved = 0
+
+    def semantic_scores(self, query, k, embed_fn):
+        """[(entry position, cosine similarity)] of the k most similar entries."""
+        with self.lock:
+            if self.vector_index is None:
+                self._load_vector_index(embed_fn)
+            self._embed_pending()
+            return self.vector_index.search(query, k)
+
+    def _load_vector_index(self, embed_fn, fresh=False):
+        from vector_index import VectorIndex
+
+        index = VectorIndex(self.vector_path, embed_fn or _default_embed_fn(), EMBED_BATCH_SIZE)
+        meta = index.meta
+        if fresh or meta.get("inode") != self._inode() or meta.get("n_docs", 0) > len(self.entries):
+            index.reset()
+        self.vector_index = index
+        self.vector_docs = index.meta.get("n_docs", 0)
+        atexit.register(self.save_vectors)
+
+    def save_vectors(self):
+        """Persist the vector index and its embedding cache next to the store."""
+        with self.lock:
+            if self.vector_index is None or not self.vector_unsaved or not os.path.exists(self.path):
+                return
+            self.vector_index.save(inode=self._inode(), n_docs=self.vector_docs)
+            self.vector_unsaved = 0
+
+    def rebuild_indexes(self, embed_fn=None):
+        """Re-index the whole file (e.g. after a compaction) and save the snapshots.
+
+        The vector index is only rebuilt if one was saved before; unchanged
+        texts come from its embedding cache.
+        """
+        with self.lock:
+            self.refresh()
+            self.keyword_index = KeywordIndex()
+            self._update_index()
+            self.keyword_index.save(self.index_path, inode=self._inode(), n_docs=self.keyword_index.n_docs)
+            self.unsaved = 0
+            atexit.register(self.save_index)
+            if os.path.isdir(self.vector_path):
+                self._load_vector_index(embed_fn, fresh=True)
+                self._embed_pending()
+                self.vector_unsaved = max(self.vector_unsaved, 1)  # save even if the store is empty
+                self.save_vectors()
+
+    def _inode(self):
+        return os.stat(self.path).st_ino if os.path.exists(self.path) else None
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _get_store(path):
+    """The shared store for `path`, loaded on first use."""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = _MemoryStore(key)
+            store.refresh()
+    return store
+
+
+def migrate_json_memory(json_path, store_path):
+    """One-time conversion of a legacy memory.json list into a JSONL store.
+
+    The legacy file is left in place; the store's existence marks the
+    migration as done.
+    """
+    with open(json_path, "rb") as legacy:
+        if fcntl is not None:
+            fcntl.flock(legacy, fcntl.LOCK_EX)
+        if os.path.exists(store_path):
+            return  # another process migrated while we waited
+        try:
+            entries = json.load(legacy)
+        except ValueError:
+            entries = []
+
+        tmp_path = f"{store_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, store_path)
+
+
+# -----------------------------------------
+# Retention and compaction
+# -----------------------------------------
+def entry_hash(entry):
+    """Content hash of an entry, ignoring its timestamp."""
+    content = {k: entry.get(k) for k in ("query", "facts", "equation_result", "explanation")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class RetentionPolicy:
+    """What compact_memory keeps.
+
+    max_entries: keep at most this many of the newest entries (None = all).
+    max_age_days: drop entries older than this (None = no limit).
+    dedup: keep only the newest of entries with the same content hash (as
+    stored, i.e. after truncation).
+    truncate_after_days / truncate_chars: shorten the explanation of entries
+    older than this many days to about truncate_chars characters.
+    """
+
+    def __init__(self, max_entries=10_000, max_age_days=None, dedup=True,
+                 truncate_after_days=7, truncate_chars=240):
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.dedup = dedup
+        self.truncate_after_days = truncate_after_days
+        self.truncate_chars = truncate_chars
+
+    def apply(self, entries, now=None):
+        now = now or datetime.now()
+        kept = []
+        seen = set()
+        for entry in reversed(entries):  # newest first, so the newest duplicate wins
+            timestamp = _entry_time(entry)
+            age = (now - timestamp).total_seconds() / 86400 if timestamp else 0.0
+            if self.max_age_days is not None and age > self.max_age_days:
+                continue
+            explanation = entry.get("explanation") or ""
+            if (self.truncate_after_days is not None and age > self.truncate_after_days
+                    and len(explanation) > self.truncate_chars):
+                entry = dict(entry, explanation=explanation[:self.truncate_chars].rstrip() + " …")
+            if self.dedup:  # after truncation, so entries that now read the same collapse
+                key = entry_hash(entry)
+                if key in seen:
+                    continue
+                seen.add(key)
+            kept.append(entry)
+            if self.max_entries is not None and len(kept) >= self.max_entries:
+                break
+        kept.reverse()
+        return kept
+
+
+def compact_memory(store_path, policy=None):
+    """Rewrite a JSONL store keeping what `policy` retains; returns (before, after).
+
+    The file is read and filtered without any lock, so writers carry on.
+    Only the swap holds the lock: lines appended meanwhile are copied over
+    as they are, then the compacted file replaces the store with os.replace.
+    Writers blocked on the old file notice the swap and retry (see
+    _MemoryStore.append).
+    """
+    policy = policy or RetentionPolicy()
+    with open(store_path, "rb") as f:
+        inode = os.fstat(f.fileno()).st_ino
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    entries = []
+    for line in data[:end].splitlines():
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    kept = policy.apply(entries)
+
+    tmp_path = f"{store_path}.{os.getpid()}.compact"
+    with open(tmp_path, "wb") as out:
+        for entry in kept:
+            out.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+
+        fd = os.open(store_path, os.O_RDWR)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_ino != inode:
+                os.remove(tmp_path)
+                raise RuntimeError(f"{store_path} was replaced during compaction")
+            os.lseek(fd, end, os.SEEK_SET)
+            tail = b"".join(iter(lambda: os.read(fd, 1 << 20), b""))
+            if tail and not tail.endswith(b"\n"):
+                tail += b"\n"
+            out.write(tail)
+            out.flush()
+            os.fsync(out.fileno())
+            os.replace(tmp_path, store_path)
+        finally:
+            os.close(fd)
+    return len(entries), len(kept) + tail.count(b"\n")
+
+
+# -----------------------------------------
+# Memory manager
+# -----------------------------------------
+def make_entry(query, facts, equation_result, explanation):
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "query": query or "",
+        "facts": facts or [],
+        "equation_result": str(equation_result) if equation_result else "None",
+        "explanation": explanation or "",
+    }
+
 
 class MemoryManager:
-    def __init__(self, path="memory.json"):
+    def __init__(self, path="memory.json", embed_fn=None):
+        """`path` may name the legacy JSON file (the store is then the .jsonl
+        next to it, migrated on first use) or the .jsonl store itself.
+        embed_fn: texts -> vectors for semantic_search (default: the shared
+        model from embedding_registry, loaded on the first semantic query)."""
         self.path = path
-        self.memory = self.load_memory()
+        self.embed_fn = embed_fn
+        root, ext = os.path.splitext(path)
+        self.store_path = path if ext == ".jsonl" else root + ".jsonl"
+        if self.store_path != path and os.path.exists(path) and not os.path.exists(self.store_path):
+            migrate_json_memory(path, self.store_path)
+        self.store = _get_store(self.store_path)
+
+    @property
+    def memory(self):
+        return self.store.entries
 
     # -----------------------------------------
     def load_memory(self):
-        """Load memory from disk."""
-        if os.path.exists(self.path):
-            try:
-                with open(self.path, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                return []
-        return []
+        """Load memory from disk (only entries not read yet)."""
+        self.store.refresh()
+        return self.store.entries
 
     # -----------------------------------------
     def save_memory(self):
-        """Persist memory to disk."""
-        with open(self.path, "w", encoding="utf-8") as f:
-            json.dump(self.memory, f, indent=2, ensure_ascii=False)
+        """Entries are persisted as they are added; kept for compatibility."""
 
     # -----------------------------------------
+    @traced("memory.write")
     def add_entry(self, query, facts, equation_result, explanation):
         """Add a new entry to memory."""
-        entry = {
-            "timestamp": datetime.now().isoformat(),
-            "query": query or "",
-            "facts": facts or [],
-            "equation_result": str(equation_result) if equation_result else "None",
-            "explanation": explanation or "",
-        }
-        self.memory.append(entry)
-        self.save_memory()
+        self.store.append(make_entry(query, facts, equation_result, explanation))
+
+    @traced("memory.write")
+    def add_entries(self, entries):
+        """Add entries built with make_entry in one write."""
+        self.store.append_many(list(entries))
 
     # -----------------------------------------
-    def search_memory(self, query):
-        """Search memory for entries related to a query."""
+    @traced("memory.search")
+    def search_memory(self, query, limit=None, recency_half_life=None):
+        """Search memory for entries related to a query, best match first.
+
+        Entries are ranked with BM25 over their query and explanation. With
+        recency_half_life (in days) a score halves for every half-life of age.
+        """
+        if not query:
+            return []
+
+        self.store.refresh()
+        scores = self.store.keyword_scores(query)
+        entries = self.memory
+        if recency_half_life:
+            now = datetime.now()
+            for i in scores:
+                try:
+                    age = (now - datetime.fromisoformat(entries[i]["timestamp"])).total_seconds() / 86400
+                except (KeyError, TypeError, ValueError):
+                    continue
+                scores[i] *= 0.5 ** (max(age, 0.0) / recency_half_life)
+
+        ranked = sorted(scores, key=lambda i: (scores[i], i), reverse=True)
+        return [entries[i] for i in ranked[:limit]]
+
+    def compact(self, policy=None):
+        """Apply a RetentionPolicy to the store, then rebuild the indexes."""
+        before, after = compact_memory(self.store_path, policy)
+        self.store.rebuild_indexes(self.embed_fn)
+        return before, after
+
+    @traced("memory.semantic_search")
+    def semantic_search(self, query, k=5):
+        """The k entries most similar to `query` by embedding, best first."""
         if not query:
             return []
 
-        query_lower = query.lower()
-        results = []
-        for m in self.memory:
-            text = f"{m.get('query', '')} {m.get('explanation', '')}".lower()
-            if any(q in text for q in query_lower.split()):
-                results.append(m)
-        return results
+        self.store.refresh()
+        return [self.memory[i] for i, _ in self.store.semantic_scores(query, k, self.embed_fn)]
+
+    def save_index(self):
+        """Write the index snapshots now (they are also saved periodically and at exit)."""
+        self.store.save_index()
+        self.store.save_vectors()
+
+
+class MemoryWriteBuffer:
+    """Collects add_entry calls and writes them to a MemoryManager in groups.
+
+    Thread-safe, so concurrent graph runs can share one buffer; entries
+    become visible to searches only once flushed (every `flush_every`
+    entries, or on flush()).
+    """
+
+    def __init__(self, manager, flush_every=100):
+        self.manager = manager
+        self.flush_every = flush_every
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def add_entry(self, query, facts, equation_result, explanation):
+        entry = make_entry(query, facts, equation_result, explanation)
+        with self.lock:
+            self.pending.append(entry)
+            if len(self.pending) < self.flush_every:
+                return
+            batch, self.pending = self.pending, []
+        self.manager.add_entries(batch)
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+        self.manager.add_entries(batch)
+
+
+if __name__ == "__main__":
+    # Offline compaction: python src/memory_manager.py [memory.json]
+    manager = MemoryManager(sys.argv[1] if len(sys.argv) > 1 else "memory.json")
+    before, after = manager.compact()
+    print(f"✅ Compacted {manager.store_path}: {before} → {after} entries")
@@ -1,6 +1,17 @@
 import json
+import os
+import random
+import shutil
+import sys
 from datetime import datetime
-from src.insight_agent import InsightAgent
+
+import numpy as np
+
+import symbolic_engine
+from data_preprocessing import write_reference_csv
+from insight_agent import InsightAgent
+from stage_cache import Pipeline
+from symbolic_simplifier import STAGE_TIMEOUT, simplify_batch, simplify_expression
 
 # Load previous data files
 def load_json(path):
@@ -10,35 +21,110 @@ def load_json(path):
     except Exception:
         return None
 
+
+# -----------------------------------------
+# Stages: func(inputs, params, out_dir)
+# -----------------------------------------
+def preprocess_stage(inputs, params, out_dir):
+    write_reference_csv(out_dir, **params)
+
+
+def regression_stage(inputs, params, out_dir):
+    params = dict(params)
+    seed = params.pop("seed")
+    random.seed(seed)
+    np.random.seed(seed)
+    data_dir = inputs["preprocess"]
+    _, _, hof, _, _, _, _, _ = symbolic_engine.run_symbolic_regression(
+        data_path=os.path.join(data_dir, "cosmology_data.csv"),
+        constants_path=os.path.join(data_dir, "constants.csv"),
+        **params
+    )
+    with open(os.path.join(out_dir, "hall_of_fame.json"), "w", encoding="utf-8") as f:
+        json.dump([{"expression": str(ind), "rmse": ind.fitness.values[0]} for ind in hof], f, indent=2)
+
+
+def _hall_of_fame(inputs):
+    return load_json(os.path.join(inputs["regression"], "hall_of_fame.json"))
+
+
+def simplify_stage(inputs, params, out_dir):
+    best = _hall_of_fame(inputs)[0]["expression"]
+    simplify_expression(best, timeout=params["timeout"],
+                        output_file=os.path.join(out_dir, "simplified_expression.json"))
+
+
+def simplify_hof_stage(inputs, params, out_dir):
+    entries = [(e["expression"], e["rmse"]) for e in _hall_of_fame(inputs)]
+    simplify_batch(entries, timeout=params["timeout"],
+                   output_path=os.path.join(out_dir, "simplified_expressions.jsonl"))
+
+
+def insight_stage(inputs, params, out_dir):
+    simplified = load_json(os.path.join(inputs["simplify"], "simplified_expression.json")) or {}
+    equation = simplified.get("simplified_expression") or "Unknown"
+    insight = InsightAgent().generate_insight(params["query"], equation, list(params["facts"]),
+                                              params["explanation"])
+    with open(os.path.join(out_dir, "insight.json"), "w", encoding="utf-8") as f:
+        json.dump(dict(params, equation=equation, insight=insight), f, indent=2)
+
+
+def build_pipeline(query, facts=(), explanation="", generations=18, pop_size=120,
+                   simplify_timeout=STAGE_TIMEOUT, **pipeline_kwargs):
+    """preprocess → regression → (simplify ∥ simplify_hof), simplify → insight.
+
+    Each stage is keyed by its code, parameters and upstream keys, so e.g. a
+    new question only re-runs the insight stage and a new GP setting re-runs
+    regression and everything after it.
+    """
+    pipeline = Pipeline(**pipeline_kwargs)
+    pipeline.add("preprocess", preprocess_stage,
+                 params={"H0": 70, "Om0": 0.3, "n_redshifts": 50},
+                 modules=("data_preprocessing",))
+    pipeline.add("regression", regression_stage, inputs=("preprocess",),
+                 params={"generations": generations, "pop_size": pop_size, "seed": symbolic_engine.RANDOM_SEED},
+                 modules=("symbolic_engine", "population_evaluator", "constant_fitting", "tree_simplification"))
+    pipeline.add("simplify", simplify_stage, inputs=("regression",),
+                 params={"timeout": simplify_timeout},
+                 modules=("symbolic_simplifier", "sympy_conversion"))
+    pipeline.add("simplify_hof", simplify_hof_stage, inputs=("regression",),
+                 params={"timeout": simplify_timeout},
+                 modules=("symbolic_simplifier", "sympy_conversion"))
+    pipeline.add("insight", insight_stage, inputs=("simplify",),
+                 params={"query": query, "facts": list(facts), "explanation": explanation},
+                 modules=("insight_agent",))
+    return pipeline
+
+
 def main():
     print("🚀 Running Cosmosym Integrated Pipeline...\n")
 
-    # 1️⃣ Load simplified expression
-    simplified_data = load_json("data/simplified_expression.json")
-    simplified_expr = simplified_data.get("simplified_expression") if simplified_data else None
-
-    # 2️⃣ Load previous memory
+    # 1️⃣ Load previous memory
     memory_data = load_json("data/memory_log.json") or []
     last_entry = memory_data[-1] if memory_data else {}
 
-    # 3️⃣ Combine context
+    # 2️⃣ Combine context
     query = last_entry.get("query", "cosmology expansion")
     facts = last_entry.get("facts", [])
     explanation = last_entry.get("explanation", "")
-    equation = simplified_expr or "Unknown"
 
-    # 4️⃣ Run the Insight Agent
-    insight_agent = InsightAgent()
-    insight = insight_agent.generate_insight(query, equation, facts, explanation)
+    # 3️⃣ Run (or reuse) every stage
+    pipeline = build_pipeline(query, facts, explanation)
+    artifacts = pipeline.run(force=sys.argv[1:])
+
+    # 4️⃣ Publish the simplified expression where the dashboards read it
+    shutil.copyfile(os.path.join(artifacts["simplify"], "simplified_expression.json"),
+                    "data/simplified_expression.json")
+    result = load_json(os.path.join(artifacts["insight"], "insight.json"))
 
     # 5️⃣ Save output with timestamp
     output = {
         "timestamp": datetime.now().isoformat(),
         "query": query,
-        "equation": equation,
+        "equation": result["equation"],
         "facts": facts,
         "explanation": explanation,
-        "insight": insight
+        "insight": result["insight"]
     }
 
     with open("data/insight_log.json", "a", encoding="utf-8") as f:
@@ -46,7 +132,7 @@ def main():
         f.write(",\n")
 
     print("\n🧠 New Insight Generated:")
-    print(insight)
+    print(result["insight"])
     print("\n✅ Insight saved to data/insight_log.json")
 
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+# src/pipeline_service.py
+# Long-lived, in-process runner for the interactive pipeline stages.
+
+import random
+
+import numpy as np
+
+import symbolic_engine
+from instrumentation import span
+from insight_agent import InsightAgent
+from symbolic_simplifier import STAGE_TIMEOUT, simplify_expression
+from sympy_conversion import SympyConverter
+
+
+class PipelineService:
+    """Runs agent graph → symbolic regression → simplification → insight as
+    function calls in one process.
+
+    Modules and models are loaded once for the lifetime of the service. The
+    GP search ignores the question, so its result is cached under its inputs
+    (dataset hash and GP parameters) and only recomputed when they change;
+    the simplification of its best individual is cached on disk by the
+    simplifier itself. Repeated questions then cost one graph run.
+    """
+
+    def __init__(self, generations=18, pop_size=120, simplify_timeout=STAGE_TIMEOUT, verbose=True):
+        self.gp_params = {"generations": generations, "pop_size": pop_size}
+        self.simplify_timeout = simplify_timeout
+        self.verbose = verbose
+        self.insight_agent = InsightAgent()
+        self._graph = None
+        self._stage_cache = {}
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _cached(self, stage, key, compute):
+        """Output of `stage` for `key`, computed only if the key changed."""
+        hit = self._stage_cache.get(stage)
+        if hit is not None and hit[0] == key:
+            self._log(f"♻️  {stage}: inputs unchanged, reusing cached output")
+            return hit[1]
+        self._log(f"\n⚙️  Running {stage}...")
+        with span(f"service.{stage}"):
+            output = compute()
+        self._stage_cache[stage] = (key, output)
+        return output
+
+    # -----------------------------------------
+    def run_graph(self, query):
+        if self._graph is None:
+            from agent_graph import graph  # imported once, on the first question
+            self._graph = graph
+        with span("service.agent_graph"):
+            return self._graph.invoke({"query": query})
+
+    def run_regression(self):
+        def compute():
+            # Same seeding as a fresh `python src/symbolic_engine.py` run
+            random.seed(symbolic_engine.RANDOM_SEED)
+            np.random.seed(symbolic_engine.RANDOM_SEED)
+            _, _, hof, _, pset, _, _, _ = symbolic_engine.run_symbolic_regression(**self.gp_params)
+            return hof[0], pset
+
+        key = (symbolic_engine.dataset_cache_key(), tuple(sorted(self.gp_params.items())))
+        return self._cached("Symbolic Regression Engine", key, compute)
+
+    def run_simplifier(self, best, pset):
+        def compute():
+            expr = SympyConverter(pset).convert(best)
+            return simplify_expression(str(best), timeout=self.simplify_timeout, expr=expr)
+
+        return self._cached("Symbolic Simplifier", str(best), compute)
+
+    # -----------------------------------------
+    def answer(self, query):
+        """Run every stage for `query`; returns a dict with the graph result,
+        the best and simplified expressions, and the generated insight."""
+        graph_result = self.run_graph(query)
+        if not isinstance(graph_result, dict):
+            self._log(f"⚠️ Agent graph returned {type(graph_result).__name__}; continuing without its facts")
+            graph_result = {}
+        best, pset = self.run_regression()
+        simplified = self.run_simplifier(best, pset)
+
+        simplified_expr = simplified.get("simplified_expression")
+        facts = list(graph_result.get("facts") or [])
+        insight = self.insight_agent.generate_insight(query, simplified_expr or "unknown_equation", facts, "")
+        return {
+            "query": query,
+            "graph": graph_result,
+            "best_expression": str(best),
+            "rmse": best.fitness.values[0],
+            "equation": simplified_expr,
+            "insight": insight,
+        }
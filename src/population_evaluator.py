@@ -0,0 +1,77 @@
+# src/population_evaluator.py
+# Whole-population fitness evaluation that walks DEAP trees directly on NumPy arrays.
+
+import numpy as np
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class SubtreeCache:
+    """Per-generation map from subtree string to its result, capped in bytes.
+
+    Once the cap is reached new results are simply not stored; everything
+    already cached stays valid for the rest of the generation.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.results = {}
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def put(self, key, value):
+        size = getattr(value, "nbytes", 8)
+        if self.nbytes + size > self.max_bytes:
+            return
+        self.results[key] = value
+        self.nbytes += size
+
+
+def evaluate_tree(individual, pset, columns, cache=None):
+    """Evaluate a PrimitiveTree on the given argument columns.
+
+    The prefix node list is walked from the end with a stack, so no Python
+    source is generated or compiled. Each non-terminal subtree is keyed by its
+    string form and looked up in / stored to `cache`.
+    """
+    stack = []
+    for node in reversed(individual):
+        if node.arity == 0:
+            value = columns[node.value] if isinstance(node.value, str) else node.value
+            stack.append((node.format(), value))
+            continue
+
+        args = [stack.pop() for _ in range(node.arity)]
+        key = f"{node.name}({', '.join(k for k, _ in args)})"
+        value = cache.get(key) if cache is not None else None
+        if value is None:
+            value = pset.context[node.name](*[v for _, v in args])
+            if cache is not None:
+                cache.put(key, value)
+        stack.append((key, value))
+    return stack[0][1]
+
+
+def evaluate_population(individuals, pset, X, y, max_cache_bytes=DEFAULT_CACHE_BYTES, rows=None):
+    """Return an array with the RMSE of every individual (1e6 on failure).
+
+    Subtrees shared by several individuals are computed once through a
+    SubtreeCache that lives for this call only. `rows` optionally restricts
+    the evaluation to a subset of X/y.
+    """
+    if rows is not None:
+        X, y = X[rows], y[rows]
+    columns = {name: np.ascontiguousarray(X[:, i]) for i, name in enumerate(pset.arguments)}
+    cache = SubtreeCache(max_cache_bytes)
+    fitness = np.empty(len(individuals))
+    for i, individual in enumerate(individuals):
+        try:
+            y_pred = evaluate_tree(individual, pset, columns, cache)
+            y_pred = np.array(y_pred, dtype=float).reshape(-1)
+            rmse = np.sqrt(np.mean((y - y_pred) ** 2))
+            fitness[i] = 1e6 if np.isnan(rmse) or np.isinf(rmse) else rmse
+        except Exception:
+            fitness[i] = 1e6
+    return fitness
@@ -0,0 +1,169 @@
+# src/stage_cache.py
+# DAG of pipeline stages whose outputs are stored under a hash of code, parameters and inputs.
+
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from instrumentation import span
+
+ARTIFACT_DIR = "data/artifacts"
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def module_hash(name):
+    """Hash of a module's source file, found without importing it."""
+    spec = importlib.util.find_spec(name)
+    if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+        raise ValueError(f"Cannot locate the source of module {name!r}")
+    return file_hash(spec.origin)
+
+
+class Stage:
+    """One pipeline step.
+
+    func(inputs, params, out_dir) writes its outputs into out_dir; `inputs`
+    maps each upstream stage name to that stage's artifact directory.
+    modules: source modules whose code determines the output.
+    files: external input files, hashed by content.
+    """
+
+    def __init__(self, name, func, inputs=(), params=None, modules=(), files=()):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.params = params or {}
+        self.modules = tuple(modules)
+        self.files = tuple(files)
+
+
+def _build_artifact(func, inputs, params, path, manifest, replace=False):
+    """Run a stage into a temporary directory, then move it into place.
+
+    With `replace` (a forced stage) an existing artifact is moved aside and
+    deleted; otherwise one that appeared meanwhile was built concurrently
+    and is kept.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    old_path = f"{path}.old-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    started = time.perf_counter()
+    try:
+        with span(f"stage.{manifest['stage']}"):
+            func(inputs, params, tmp_path)
+        manifest = dict(manifest, seconds=time.perf_counter() - started)
+        with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, default=str)
+        if replace and os.path.exists(path):
+            os.replace(path, old_path)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:  # built concurrently by someone else; theirs is just as good
+            if not os.path.exists(os.path.join(path, "manifest.json")):
+                raise
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.rmtree(old_path, ignore_errors=True)
+    return path
+
+
+class Pipeline:
+    """Runs stages in dependency order, reusing artifacts whose key already exists.
+
+    A stage's key hashes its code (module sources), parameters, external
+    files and the keys of its inputs, so changing a constant or a GP
+    parameter invalidates exactly the stages downstream of it. Artifacts
+    live in artifact_dir/<stage>/<key>/ with a manifest.json written last.
+    Stages whose inputs are ready run concurrently in `executor`
+    ("process" or "thread").
+    """
+
+    def __init__(self, artifact_dir=ARTIFACT_DIR, max_workers=None, executor="process", verbose=True):
+        self.artifact_dir = artifact_dir
+        self.max_workers = max_workers
+        self.executor = executor
+        self.verbose = verbose
+        self.stages = {}
+
+    def add(self, name, func, inputs=(), params=None, modules=(), files=()):
+        for dep in inputs:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name!r} depends on unknown stage {dep!r}")
+        self.stages[name] = Stage(name, func, inputs, params, modules, files)
+        return self.stages[name]
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def stage_key(self, stage, keys):
+        recipe = {
+            "stage": stage.name,
+            "code": {name: module_hash(name) for name in stage.modules},
+            "params": stage.params,
+            "files": {path: file_hash(path) for path in stage.files},
+            "inputs": {dep: keys[dep] for dep in stage.inputs},
+        }
+        return hashlib.sha256(json.dumps(recipe, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:24]
+
+    def artifact_path(self, name, key):
+        return os.path.join(self.artifact_dir, name, key)
+
+    def _required(self, targets):
+        """Names of the targets and everything they depend on, in insertion (= topological) order."""
+        needed = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in needed:
+                needed.add(name)
+                stack.extend(self.stages[name].inputs)
+        return [name for name in self.stages if name in needed]
+
+    def run(self, targets=None, force=()):
+        """Bring `targets` (default: all stages) up to date; returns {stage: artifact dir}."""
+        remaining = self._required(targets or list(self.stages))
+        keys, paths, pending = {}, {}, {}
+        pool_cls = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+        with pool_cls(max_workers=self.max_workers) as pool:
+            while remaining or pending:
+                for name in list(remaining):
+                    stage = self.stages[name]
+                    if not all(dep in paths for dep in stage.inputs):
+                        continue
+                    remaining.remove(name)
+                    keys[name] = self.stage_key(stage, keys)
+                    path = self.artifact_path(name, keys[name])
+                    if name not in force and os.path.exists(os.path.join(path, "manifest.json")):
+                        self._log(f"♻️  {name}: up to date ({keys[name]})")
+                        paths[name] = path
+                        continue
+
+                    self._log(f"⚙️  {name}: running ({keys[name]})")
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    manifest = {"stage": name, "key": keys[name], "params": stage.params,
+                                "inputs": {dep: keys[dep] for dep in stage.inputs}}
+                    future = pool.submit(_build_artifact, stage.func, {dep: paths[dep] for dep in stage.inputs},
+                                         stage.params, path, manifest, name in force)
+                    pending[future] = name
+                if not pending:
+                    continue
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    paths[name] = future.result()
+                    self._log(f"✅ {name}: done")
+        return paths
@@ -1,9 +1,18 @@
 # src/symbolic_engine.py
 # Corrected symbolic regression engine using DEAP to rediscover Friedmann-like relations.
 
+import copy
+import gzip
+import hashlib
 import math
+import multiprocessing
 import operator
+import os
+import pickle
 import random
+import threading
+import time
+from collections import OrderedDict
 from functools import partial
 
 import numpy as np
@@ -11,7 +20,14 @@ import pandas as pd
 from astropy.cosmology import FlatLambdaCDM
 from deap import base, creator, gp, tools, algorithms
 
+from constant_fitting import ConstantFitter
+from data_preprocessing import load_columnar_dataset
+from instrumentation import span
+from population_evaluator import evaluate_population
+from tree_simplification import simplify_tree
+
 RANDOM_SEED = 42
+CXPB, MUTPB = 0.5, 0.2
 random.seed(RANDOM_SEED)
 np.random.seed(RANDOM_SEED)
 
@@ -19,10 +35,16 @@ np.random.seed(RANDOM_SEED)
 # -------------------------
 # 1) Prepare dataset
 # -------------------------
-def prepare_dataset():
-    df = pd.read_csv("data/processed/cosmology_data.csv")
+DATA_PATH = "data/processed/cosmology_data.csv"
+CONSTANTS_PATH = "data/processed/constants.csv"
+DATASET_CACHE_DIR = "data/processed/cache"
+DATASET_CACHE_VERSION = 1
+
+
+def load_constants(constants_path=CONSTANTS_PATH):
+    """Return (H0, Omega_matter, Omega_lambda), falling back to 70 / 0.3 / 0.7."""
     try:
-        consts = pd.read_csv("data/processed/constants.csv").to_dict(orient="records")[0]
+        consts = pd.read_csv(constants_path).to_dict(orient="records")[0]
         H0_val = float(consts.get("H0_current", 70.0))
         Om0_val = float(consts.get("Omega_matter", 0.3))
         Omega_lambda = float(consts.get("Omega_lambda", 0.7))
@@ -30,19 +52,66 @@ def prepare_dataset():
         H0_val = 70.0
         Om0_val = 0.3
         Omega_lambda = 0.7
+    return H0_val, Om0_val, Omega_lambda
 
-    cosmo = FlatLambdaCDM(H0=H0_val, Om0=Om0_val)
 
-    z = df["redshift_z"].values
-    Hvals = np.array([cosmo.H(zz).value for zz in z])
-    H2 = Hvals ** 2
+def dataset_cache_key(data_path=DATA_PATH, constants_path=CONSTANTS_PATH):
+    """Hash of the input files' contents (and the preparation version)."""
+    digest = hashlib.sha256(f"dataset-v{DATASET_CACHE_VERSION}".encode())
+    for path in (data_path, constants_path):
+        digest.update(b"\0")
+        if not os.path.exists(path):
+            digest.update(b"<missing>")
+            continue
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:20]
+
+
+def build_dataset(z, H0_val, Om0_val, Omega_lambda):
+    """Features (rho proxy, Lambda proxy) and target H(z)^2 for an array of redshifts."""
+    cosmo = FlatLambdaCDM(H0=H0_val, Om0=Om0_val)
+    # One vectorised E(z) call instead of a Quantity-returning cosmo.H per row.
+    H2 = (H0_val * cosmo.efunc(z)) ** 2
 
     rho0_proxy = Om0_val
     rho_proxy = rho0_proxy * (1 + z) ** 3
     Lambda_proxy = np.full_like(z, Omega_lambda)
 
     X = np.vstack([rho_proxy, Lambda_proxy]).T
-    y = H2
+    return X, H2
+
+
+def prepare_dataset(data_path=DATA_PATH, constants_path=CONSTANTS_PATH, cache_dir=DATASET_CACHE_DIR):
+    """Return X, y, z for the GP run.
+
+    `data_path` may also be a directory written by
+    data_preprocessing.generate_synthetic_dataset; its columns are then
+    memory-mapped rather than read.
+    Prepared arrays are cached as .npz under `cache_dir`, keyed by a hash of
+    both CSVs, so unchanged inputs are never parsed twice (cache_dir=None
+    disables the cache).
+    """
+    if os.path.isdir(data_path):
+        return load_columnar_dataset(data_path)
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f"dataset_{dataset_cache_key(data_path, constants_path)}.npz")
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                return cached["X"], cached["y"], cached["z"]
+
+    z = pd.read_csv(data_path, usecols=["redshift_z"])["redshift_z"].to_numpy(dtype=float)
+    X, y = build_dataset(z, *load_constants(constants_path))
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, X=X, y=y, z=z)
+        os.replace(tmp_path, cache_path)
     return X, y, z
 
 
@@ -110,43 +179,830 @@ def setup_gp():
 
 
 # -------------------------
-# 4) Run symbolic regression
+# 4) Fitness evaluation
 # -------------------------
-def run_symbolic_regression(generations=20, pop_size=200):
-    X, y, z = prepare_dataset()
-    toolbox, pset = setup_gp()
+def evaluate_individual(individual, compile_fn, X, y, rows=None):
+    """RMSE of an individual against the target (1e6 on numerical failure).
 
-    # Define evaluator that uses toolbox.compile (no recursion)
-    def evaluate_individual(individual):
-        func = toolbox.compile(expr=individual)
-        try:
-            y_pred = func(X[:, 0], X[:, 1])
-            y_pred = np.array(y_pred, dtype=float).reshape(-1)
-            rmse = np.sqrt(np.mean((y - y_pred) ** 2))
-            if np.isnan(rmse) or np.isinf(rmse):
-                return (1e6,)
-            return (rmse,)
-        except Exception:
+    rows: optional index array restricting the evaluation to a subset of X/y.
+    """
+    if rows is not None:
+        X, y = X[rows], y[rows]
+    func = compile_fn(expr=individual)
+    try:
+        y_pred = func(X[:, 0], X[:, 1])
+        y_pred = np.array(y_pred, dtype=float).reshape(-1)
+        rmse = np.sqrt(np.mean((y - y_pred) ** 2))
+        if np.isnan(rmse) or np.isinf(rmse):
             return (1e6,)
+        return (rmse,)
+    except Exception:
+        return (1e6,)
 
-    toolbox.register("evaluate", evaluate_individual)
 
-    pop = toolbox.population(n=pop_size)
-    hof = tools.HallOfFame(5)
+# Per-process state for pool workers: the dataset is shipped once through the
+# pool initializer instead of being pickled with every task.
+_worker_state = {}
+
+
+def _init_worker(X, y):
+    """Pool initializer: build the primitive set and keep X/y in the worker.
+
+    X may be the path of a columnar dataset, which each worker memory-maps
+    itself instead of receiving a pickled copy.
+    """
+    if isinstance(X, str):
+        X, y, _ = load_columnar_dataset(X)
+    toolbox, pset = setup_gp()
+    _worker_state["compile"] = toolbox.compile
+    _worker_state["pset"] = pset
+    _worker_state["X"] = X
+    _worker_state["y"] = y
+
+
+def _evaluate_in_worker(individual, rows=None):
+    return evaluate_individual(
+        individual, _worker_state["compile"], _worker_state["X"], _worker_state["y"], rows
+    )
+
+
+def _evaluate_population_in_worker(task):
+    individuals, rows = task
+    return evaluate_population(
+        individuals, _worker_state["pset"], _worker_state["X"], _worker_state["y"], rows=rows
+    )
+
+
+def _evaluate_population_chunks(individuals, pool, workers, rows=None):
+    """Split a batch into one contiguous chunk per worker and concatenate the results."""
+    step = -(-len(individuals) // workers) or 1
+    tasks = [(individuals[i:i + step], rows) for i in range(0, len(individuals), step)]
+    return np.concatenate(pool.map(_evaluate_population_in_worker, tasks) or [np.empty(0)])
+
+
+# -------------------------
+# 5) Fitness cache
+# -------------------------
+COMMUTATIVE_PRIMITIVES = {"add", "mul"}
+
+
+def canonical_key(individual):
+    """String form of a tree with add/mul operands sorted.
+
+    Floating-point add and mul are commutative, so reordered operands give the
+    same fitness and can share a cache entry.
+    """
+    stack = []
+    for node in reversed(individual):
+        if node.arity == 0:
+            stack.append(node.format())
+            continue
+        args = [stack.pop() for _ in range(node.arity)]
+        if node.name in COMMUTATIVE_PRIMITIVES:
+            args.sort()
+        stack.append(f"{node.name}({', '.join(args)})")
+    return stack[0]
+
+
+class Canonicalizer:
+    """Per-generation bloat control and duplicate elimination.
+
+    Unevaluated individuals are shrunk in place with simplify_tree (constant
+    folding and identity removal); the shorter trees compute the same values,
+    so fitness is unaffected. With replace_duplicates, every individual whose
+    canonical_key was already seen in the generation is replaced by a fresh
+    random one. Must run before the individuals are evaluated.
+    """
+
+    def __init__(self, pset, toolbox, replace_duplicates=True):
+        self.pset = pset
+        self.toolbox = toolbox
+        self.replace_duplicates = replace_duplicates
+        self.shrunk = 0
+        self.replaced = 0
+
+    def apply(self, population):
+        for ind in population:
+            if not ind.fitness.valid:
+                nodes = simplify_tree(ind, self.pset)
+                if len(nodes) < len(ind):
+                    ind[0:len(ind)] = nodes
+                    self.shrunk += 1
+
+        if self.replace_duplicates:
+            seen = set()
+            for i, ind in enumerate(population):
+                key = canonical_key(ind)
+                if key in seen:
+                    population[i] = self.toolbox.individual()
+                    self.replaced += 1
+                seen.add(key)
+
+    def take_counts(self):
+        """Return (shrunk, replaced) since the last call and reset them."""
+        counts = (self.shrunk, self.replaced)
+        self.shrunk = self.replaced = 0
+        return counts
+
+
+def sel_parsimony_tournament(individuals, k, tournsize):
+    """Tournament selection with lexicographic parsimony pressure: the best
+    fitness wins and ties go to the smaller tree (Luke & Panait, 2002)."""
+    chosen = []
+    for _ in range(k):
+        aspirants = tools.selRandom(individuals, tournsize)
+        chosen.append(max(aspirants, key=lambda ind: (ind.fitness, -len(ind))))
+    return chosen
+
+
+def register_selection(toolbox, parsimony=None):
+    """parsimony: None keeps plain tournaments; "lexicographic" breaks fitness
+    ties by size; "double" uses DEAP's double tournament on fitness and size."""
+    if parsimony == "lexicographic":
+        toolbox.register("select", sel_parsimony_tournament, tournsize=3)
+    elif parsimony == "double":
+        toolbox.register("select", tools.selDoubleTournament, fitness_size=3, parsimony_size=1.4, fitness_first=True)
+    elif parsimony is not None:
+        raise ValueError(f"Unknown parsimony selection: {parsimony!r}")
+
+
+class FitnessCache:
+    """Bounded map from canonical tree key to fitness values.
+
+    LRU is approximated with two plain dicts: a hit in the older half is
+    promoted to the younger one, and when the younger half fills up the older
+    one is dropped. Plain dicts (unlike OrderedDict) copy fast, which keeps
+    checkpoint snapshots cheap.
+    """
+
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self.young = {}
+        self.old = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.young) + len(self.old)
+
+    def get(self, key):
+        fit = self.young.get(key)
+        if fit is None:
+            fit = self.old.pop(key, None)
+            if fit is not None:
+                self._store(key, fit)
+        if fit is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return fit
+
+    def put(self, key, fit):
+        self._store(key, fit)
+
+    def _store(self, key, fit):
+        self.young[key] = fit
+        if len(self.young) >= max(1, self.maxsize // 2):
+            self.old, self.young = self.young, {}
+
+    def snapshot(self):
+        return self.young.copy(), self.old.copy()
+
+    def restore(self, snapshot):
+        self.young, self.old = snapshot
+
+    def take_counts(self):
+        """Return (hits, misses) since the last call and reset them."""
+        counts = (self.hits, self.misses)
+        self.hits = self.misses = 0
+        return counts
+
+
+def _evaluate_batch(individuals, toolbox, rows=None):
+    if hasattr(toolbox, "evaluate_population"):
+        return [(fit,) for fit in toolbox.evaluate_population(individuals, rows=rows)]
+    if rows is None:
+        return toolbox.map(toolbox.evaluate, individuals)
+    return toolbox.map(partial(toolbox.evaluate, rows=rows), individuals)
+
+
+def evaluate_invalid(individuals, toolbox, cache=None, batch=None):
+    """Assign fitness to individuals with an invalid fitness.
+
+    With a cache, only one representative per unseen canonical key is
+    evaluated. If the toolbox registers `evaluate_population`, the whole batch
+    goes through it in one call; otherwise toolbox.map(toolbox.evaluate, ...)
+    is used. `batch` is a (batch_id, rows) pair from RowSampler restricting
+    evaluation to a subset of the data. Returns the number of evaluations
+    actually performed.
+    """
+    batch_id, rows = batch if batch is not None else (None, None)
+    invalid = [ind for ind in individuals if not ind.fitness.valid]
+    if cache is None:
+        fitnesses = _evaluate_batch(invalid, toolbox, rows)
+        for ind, fit in zip(invalid, fitnesses):
+            ind.fitness.values = fit
+        return len(invalid)
+
+    pending = OrderedDict()
+    for ind in invalid:
+        key = canonical_key(ind) if batch_id is None else (batch_id, canonical_key(ind))
+        if key in pending:
+            cache.hits += 1
+            pending[key].append(ind)
+            continue
+        fit = cache.get(key)
+        if fit is None:
+            pending[key] = [ind]
+        else:
+            ind.fitness.values = fit
+
+    representatives = [group[0] for group in pending.values()]
+    fitnesses = _evaluate_batch(representatives, toolbox, rows)
+    for (key, group), fit in zip(pending.items(), fitnesses):
+        cache.put(key, fit)
+        for ind in group:
+            ind.fitness.values = fit
+    return len(representatives)
+
+
+class RowSampler:
+    """Rotating random subsets of the dataset rows for mini-batch fitness.
+
+    Row i belongs to batch i % n_batches, so every batch is spread over the
+    whole (redshift-sorted) dataset; the order in which batches are visited is
+    reshuffled with np.random at the start of every cycle.
+    """
+
+    def __init__(self, n_rows, batch_size):
+        self.n_rows = n_rows
+        self.n_batches = max(1, -(-n_rows // batch_size))
+        self.order = []
+        self.position = 0
+
+    def next_batch(self):
+        """Return (batch_id, rows) for the next generation."""
+        if self.position >= len(self.order):
+            self.order = np.random.permutation(self.n_batches).tolist()
+            self.position = 0
+        batch_id = self.order[self.position]
+        self.position += 1
+        return batch_id, np.arange(batch_id, self.n_rows, self.n_batches)
+
+    def snapshot(self):
+        return {"order": list(self.order), "position": self.position}
+
+    def restore(self, snapshot):
+        self.order, self.position = list(snapshot["order"]), snapshot["position"]
+
+
+def update_halloffame(halloffame, individuals, toolbox, cache=None, batch=None):
+    """Update the hall of fame; returns (extra evaluations, fitness noise).
+
+    Under mini-batch evaluation the best individuals are first cloned and
+    re-scored on the full data, so the hall of fame only ever holds full-data
+    fitness. The noise is the mean relative gap between their batch and full
+    RMSE (None without a batch).
+    """
+    if batch is None:
+        halloffame.update(individuals)
+        return 0, None
+
+    best = tools.selBest(individuals, halloffame.maxsize)
+    candidates = [toolbox.clone(ind) for ind in best]
+    for ind in candidates:
+        del ind.fitness.values
+    nevals = evaluate_invalid(candidates, toolbox, cache)
+    halloffame.update(candidates)
+
+    batch_fit = np.array([ind.fitness.values[0] for ind in best])
+    full_fit = np.array([ind.fitness.values[0] for ind in candidates])
+    return nevals, float(np.mean(np.abs(batch_fit - full_fit) / np.maximum(full_fit, 1e-12)))
+
+
+class StoppingCriteria:
+    """Early stopping and compute budgets for the evolution loop.
+
+    target_rmse: stop once the best RMSE is at or below this value.
+    patience: stop after this many generations without improvement.
+    max_evals: stop once this many fitness evaluations have been spent.
+    max_time: wall-clock budget in seconds; the loop stops as soon as another
+    generation of the last observed duration would overrun it.
+    """
+
+    def __init__(self, target_rmse=None, patience=None, max_evals=None, max_time=None):
+        self.target_rmse = target_rmse
+        self.patience = patience
+        self.max_evals = max_evals
+        self.max_time = max_time
+        self.best = math.inf
+        self.stale = 0
+        self.evals = 0
+        self.elapsed = 0.0
+        self.reason = None
+
+    def update(self, best, nevals, seconds, generations=1):
+        """Account for `generations` more generations; return the stop reason or None."""
+        self.evals += nevals
+        self.elapsed += seconds
+        if best < self.best:
+            self.best, self.stale = best, 0
+        else:
+            self.stale += generations
+
+        if self.target_rmse is not None and self.best <= self.target_rmse:
+            self.reason = f"target RMSE {self.target_rmse:g} reached"
+        elif self.patience is not None and self.stale >= self.patience:
+            self.reason = f"no improvement for {self.stale} generations"
+        elif self.max_evals is not None and self.evals >= self.max_evals:
+            self.reason = f"evaluation budget of {self.max_evals} spent"
+        elif self.max_time is not None and self.elapsed + seconds / generations > self.max_time:
+            self.reason = f"wall-time budget of {self.max_time:g}s reached"
+        return self.reason
+
+    def snapshot(self):
+        return {"best": self.best, "stale": self.stale, "evals": self.evals, "elapsed": self.elapsed}
+
+    def restore(self, snapshot):
+        self.__dict__.update(snapshot)
+
+
+def evolve(population, toolbox, cxpb, mutpb, ngen, stats=None,
+           halloffame=None, verbose=__debug__, cache=None,
+           checkpointer=None, start_gen=0, logbook=None, constant_fitter=None,
+           stopping=None, sampler=None, canonicalizer=None):
+    """Same generational loop as algorithms.eaSimple, with an optional
+    fitness cache whose per-generation hits/misses go into the logbook.
+
+    With a constant_fitter, the best individuals of each generation get their
+    constants tuned (see constant_fitting) before the hall of fame is updated.
+    With `stopping` (a StoppingCriteria) the loop may end before `ngen`; the
+    reason is left in stopping.reason. With a `sampler` (RowSampler) every
+    generation is scored on a fresh mini-batch and only hall-of-fame
+    candidates are re-scored on the full data. With a `canonicalizer`, new
+    individuals are simplified and duplicates replaced before evaluation.
+    Each logbook row carries the wall time of its generation.
+
+    To continue a checkpointed run pass its logbook and `start_gen`; the
+    population is then assumed to be already evaluated.
+    """
+    def score(individuals):
+        """Evaluate, tune and update the hall of fame; returns (nevals, noise)."""
+        if canonicalizer is not None:
+            canonicalizer.apply(individuals)
+        batch = None
+        if sampler is not None:
+            batch = sampler.next_batch()
+            for ind in individuals:
+                if ind.fitness.valid:
+                    del ind.fitness.values
+        with span("gp.evaluate"):
+            nevals = evaluate_invalid(individuals, toolbox, cache, batch)
+        if constant_fitter is not None:
+            constant_fitter.tune(individuals, rows=None if batch is None else batch[1])
+        noise = None
+        if halloffame is not None:
+            extra, noise = update_halloffame(halloffame, individuals, toolbox, cache, batch)
+            nevals += extra
+        return nevals, noise
+
+    def record_generation(gen, population, nevals, noise, started):
+        seconds = time.perf_counter() - started
+        record = stats.compile(population) if stats else {}
+        if cache is not None:
+            record["hits"], record["misses"] = cache.take_counts()
+        if constant_fitter is not None:
+            record["tuned"] = constant_fitter.take_count()
+        if canonicalizer is not None:
+            record["shrunk"], record["dups"] = canonicalizer.take_counts()
+        if sampler is not None:
+            record["noise"] = noise
+        logbook.record(gen=gen, nevals=nevals, time=seconds, **record)
+        if verbose:
+            print(logbook.stream)
+
+        reason = None
+        if stopping is not None:
+            best = halloffame[0].fitness.values[0] if halloffame else min(ind.fitness.values[0] for ind in population)
+            reason = stopping.update(best, nevals, seconds)
+        if checkpointer is not None and (gen % checkpointer.every == 0 or gen == ngen or reason):
+            checkpointer.save(gen, population, halloffame, logbook, cache, constant_fitter, stopping, sampler)
+        if reason and verbose:
+            print(f"Stopping after generation {gen}: {reason}")
+        return reason
+
+    if logbook is None:
+        started = time.perf_counter()
+        logbook = tools.Logbook()
+        cache_fields = ["hits", "misses"] if cache is not None else []
+        tuned_fields = ["tuned"] if constant_fitter is not None else []
+        noise_fields = ["noise"] if sampler is not None else []
+        canon_fields = ["shrunk", "dups"] if canonicalizer is not None else []
+        logbook.header = (["gen", "nevals"] + cache_fields + tuned_fields + noise_fields + canon_fields
+                          + (stats.fields if stats else []) + ["time"])
+
+        with span("gp.generation", gen=0):
+            nevals, noise = score(population)
+            stop = record_generation(0, population, nevals, noise, started)
+        if stop:
+            return population, logbook
+
+    for gen in range(start_gen + 1, ngen + 1):
+        with span("gp.generation", gen=gen):
+            started = time.perf_counter()
+            offspring = toolbox.select(population, len(population))
+            offspring = algorithms.varAnd(offspring, toolbox, cxpb, mutpb)
+
+            nevals, noise = score(offspring)
+
+            population[:] = offspring
+            stop = record_generation(gen, population, nevals, noise, started)
+        if stop:
+            break
+
+    return population, logbook
+
+
+# -------------------------
+# 6) Checkpointing
+# -------------------------
+CHECKPOINT_CHUNK = 256
+
+
+class Checkpointer:
+    """Periodically saves the evolution state to a gzip stream of pickles.
+
+    The loop thread only takes a shallow snapshot (evaluated individuals are
+    never modified afterwards, varAnd works on clones). A background thread
+    pickles it in small chunks, so the GIL is handed back to the loop between
+    chunks, and replaces the checkpoint file atomically once it is on disk.
+    """
+
+    def __init__(self, path, every=10):
+        self.path = path
+        self.every = every
+        self._writer = None
+
+    def save(self, gen, population, halloffame, logbook, cache, constant_fitter=None, stopping=None,
+             sampler=None):
+        state = {
+            "generation": gen,
+            "population": list(population),
+            "halloffame": None if halloffame is None else (list(halloffame.items), list(halloffame.keys)),
+            "logbook": copy.copy(logbook),
+            "cache": None if cache is None else cache.snapshot(),
+            "constant_fitter": None if constant_fitter is None else constant_fitter.snapshot(),
+            "stopping": None if stopping is None else stopping.snapshot(),
+            "sampler": None if sampler is None else sampler.snapshot(),
+            "random_state": random.getstate(),
+            "numpy_random_state": np.random.get_state(),
+        }
+        self.wait()
+        self._writer = threading.Thread(target=self._write, args=(state,), daemon=True)
+        self._writer.start()
+
+    def _write(self, state):
+        population = state.pop("population")
+        cache = state.pop("cache")
+        state["population_size"] = len(population)
+        state["cache_sizes"] = None if cache is None else tuple(len(part) for part in cache)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=3) as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                for i in range(0, len(population), CHECKPOINT_CHUNK):
+                    pickle.dump(population[i:i + CHECKPOINT_CHUNK], f, protocol=pickle.HIGHEST_PROTOCOL)
+                for part in cache or ():
+                    items = list(part.items())
+                    for i in range(0, len(items), CHECKPOINT_CHUNK * 16):
+                        pickle.dump(items[i:i + CHECKPOINT_CHUNK * 16], f, protocol=pickle.HIGHEST_PROTOCOL)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, self.path)
+
+    def wait(self):
+        """Block until the pending write, if any, has reached disk."""
+        if self._writer is not None:
+            self._writer.join()
+            self._writer = None
+
+
+def rebind_ephemerals(individuals, pset):
+    """Point unpickled ephemeral constants back at the classes of `pset`.
+
+    Unpickling recreates ephemeral classes (see gp.MetaEphemeral), and
+    Terminal equality compares types, so without this the hall of fame would
+    no longer recognise duplicates of restored individuals.
+    """
+    for ind in individuals:
+        for node in ind:
+            if isinstance(type(node), gp.MetaEphemeral) and type(node) is not pset.mapping[node.name]:
+                node.__class__ = pset.mapping[node.name]
+    return individuals
+
+
+def load_checkpoint(path, pset):
+    """Read a state saved by Checkpointer."""
+    def read_items(f, count):
+        items = []
+        while len(items) < count:
+            items.extend(pickle.load(f))
+        return items
+
+    with gzip.open(path, "rb") as f:
+        state = pickle.load(f)
+        state["population"] = read_items(f, state.pop("population_size"))
+        cache_sizes = state.pop("cache_sizes")
+        state["cache"] = None if cache_sizes is None else tuple(dict(read_items(f, n)) for n in cache_sizes)
+
+    rebind_ephemerals(state["population"], pset)
+    if state["halloffame"] is not None:
+        rebind_ephemerals(state["halloffame"][0], pset)
+    return state
+
+
+# -------------------------
+# 7) Run symbolic regression
+# -------------------------
+def _worker_dataset(data_path, X, y):
+    """Pool initargs: the path for memory-mapped datasets, the arrays otherwise."""
+    return (data_path, None) if os.path.isdir(data_path) else (X, y)
+
+
+def register_evaluators(toolbox, pset, X, y, evaluator="batch", pool=None, workers=None):
+    """Register `evaluate` (and `evaluate_population` for the batch evaluator),
+    dispatching to `pool` when one is given."""
+    if pool is not None:
+        toolbox.register("map", pool.map)
+        toolbox.register("evaluate", _evaluate_in_worker)
+    else:
+        toolbox.register("evaluate", evaluate_individual, compile_fn=toolbox.compile, X=X, y=y)
+
+    if evaluator == "batch":
+        if pool is not None:
+            toolbox.register("evaluate_population", _evaluate_population_chunks, pool=pool, workers=workers)
+        else:
+            toolbox.register("evaluate_population", evaluate_population, pset=pset, X=X, y=y)
+    elif evaluator != "compile":
+        raise ValueError(f"Unknown evaluator: {evaluator!r}")
+
+
+def make_stats():
     stats = tools.Statistics(lambda ind: ind.fitness.values)
     stats.register("avg", np.mean)
     stats.register("min", np.min)
     stats.register("std", np.std)
+    return stats
+
+
+def run_symbolic_regression(generations=20, pop_size=200, workers=None, cache_size=100_000,
+                            evaluator="batch", checkpoint_path=None, checkpoint_every=10,
+                            resume_from=None, constant_top_k=0, target_rmse=None, patience=None,
+                            max_evals=None, max_time=None, data_path=DATA_PATH, batch_size=None,
+                            canonicalize=False, parsimony=None, constants_path=CONSTANTS_PATH):
+    """Run the GP search.
+
+    workers: number of processes used to evaluate fitness (None or 1 = serial).
+    Evaluation is deterministic and pool.map keeps ordering, so a parallel run
+    matches the serial one for the same RANDOM_SEED.
+    cache_size: capacity of the LRU fitness cache (0 or None disables it).
+    evaluator: "batch" walks every tree of a generation on NumPy arrays in one
+    call (see population_evaluator); "compile" uses gp.compile per individual.
+    checkpoint_path / checkpoint_every: save the full state (population, hall
+    of fame, logbook, fitness cache, RNG states) every N generations.
+    resume_from: checkpoint file to continue from; the resumed run is
+    identical to an uninterrupted one with the same arguments.
+    constant_top_k: tune the constants of the k best individuals of every
+    generation with least squares (0 disables it).
+    target_rmse / patience / max_evals / max_time: stopping criteria and
+    budgets, see StoppingCriteria.
+    data_path / constants_path: CSV (or columnar dataset directory) and
+    constants file, see prepare_dataset.
+    batch_size: score each generation on a rotating subset of about this many
+    rows (see RowSampler); hall-of-fame candidates are re-scored on all rows.
+    canonicalize: simplify new individuals and replace duplicates every
+    generation (see Canonicalizer).
+    parsimony: size-aware selection, "lexicographic" or "double" (see
+    register_selection).
+    """
+    X, y, z = prepare_dataset(data_path, constants_path)
+    toolbox, pset = setup_gp()
+    register_selection(toolbox, parsimony)
+
+    pool = None
+    if workers is not None and workers > 1:
+        pool = multiprocessing.Pool(processes=workers, initializer=_init_worker, initargs=_worker_dataset(data_path, X, y))
+    register_evaluators(toolbox, pset, X, y, evaluator, pool=pool, workers=workers)
+
+    hof = tools.HallOfFame(5)
+    stats = make_stats()
+
+    cache = FitnessCache(cache_size) if cache_size else None
+    constant_fitter = ConstantFitter(pset, X, y, top_k=constant_top_k) if constant_top_k else None
+    stopping = None
+    if any(v is not None for v in (target_rmse, patience, max_evals, max_time)):
+        stopping = StoppingCriteria(target_rmse, patience, max_evals, max_time)
+    sampler = RowSampler(len(y), batch_size) if batch_size and batch_size < len(y) else None
+    canonicalizer = Canonicalizer(pset, toolbox) if canonicalize else None
+    checkpointer = Checkpointer(checkpoint_path, checkpoint_every) if checkpoint_path else None
+
+    start_gen, log = 0, None
+    if resume_from is not None:
+        state = load_checkpoint(resume_from, pset)
+        pop = state["population"]
+        if state["halloffame"] is not None:
+            hof.items, hof.keys = state["halloffame"]
+        if cache is not None and state["cache"] is not None:
+            cache.restore(state["cache"])
+        if constant_fitter is not None and state["constant_fitter"] is not None:
+            constant_fitter.restore(state["constant_fitter"])
+        if stopping is not None and state["stopping"] is not None:
+            stopping.restore(state["stopping"])
+        if sampler is not None and state["sampler"] is not None:
+            sampler.restore(state["sampler"])
+        random.setstate(state["random_state"])
+        np.random.set_state(state["numpy_random_state"])
+        start_gen, log = state["generation"], state["logbook"]
+    else:
+        pop = toolbox.population(n=pop_size)
+
+    try:
+        pop, log = evolve(
+            pop, toolbox, cxpb=CXPB, mutpb=MUTPB, ngen=generations,
+            stats=stats, halloffame=hof, verbose=True, cache=cache,
+            checkpointer=checkpointer, start_gen=start_gen, logbook=log,
+            constant_fitter=constant_fitter, stopping=stopping, sampler=sampler,
+            canonicalizer=canonicalizer
+        )
+    finally:
+        if checkpointer is not None:
+            checkpointer.wait()
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return pop, log, hof, toolbox, pset, X, y, z
 
-    pop, log = algorithms.eaSimple(
-        pop, toolbox, cxpb=0.5, mutpb=0.2, ngen=generations,
-        stats=stats, halloffame=hof, verbose=True
+
+# -------------------------
+# 8) Island model
+# -------------------------
+def _run_island_epoch(task):
+    """Evolve one island from task["start_gen"] to task["end_gen"] in a pool worker.
+
+    Each island carries its own RNG states and caches, so results do not
+    depend on which worker process picks the task up.
+    """
+    if "island_toolbox" not in _worker_state:
+        toolbox, pset = setup_gp()
+        register_evaluators(toolbox, pset, _worker_state["X"], _worker_state["y"], task["evaluator"])
+        _worker_state["island_toolbox"] = toolbox
+        _worker_state["island_pset"] = pset
+    toolbox = _worker_state["island_toolbox"]
+    cache = None
+    if task["cache_size"]:
+        cache = FitnessCache(task["cache_size"])
+        if task["fitness_cache"] is not None:
+            cache.restore(task["fitness_cache"])
+    register_selection(toolbox, task["parsimony"])
+    canonicalizer = Canonicalizer(_worker_state["island_pset"], toolbox) if task["canonicalize"] else None
+    constant_fitter = None
+    if task["constant_top_k"]:
+        constant_fitter = ConstantFitter(_worker_state["island_pset"], _worker_state["X"], _worker_state["y"],
+                                         top_k=task["constant_top_k"])
+        constant_fitter.restore(task["constant_cache"])
+    sampler = None
+    if task["batch_size"] and task["batch_size"] < len(_worker_state["y"]):
+        sampler = RowSampler(len(_worker_state["y"]), task["batch_size"])
+        if task["sampler_state"] is not None:
+            sampler.restore(task["sampler_state"])
+
+    random.setstate(task["random_state"])
+    np.random.set_state(task["numpy_random_state"])
+    if task["population"] is None:
+        population = toolbox.population(n=task["pop_size"])
+    else:
+        population = rebind_ephemerals(task["population"], _worker_state["island_pset"])
+
+    hof = tools.HallOfFame(task["hof_size"])
+    population, logbook = evolve(
+        population, toolbox, cxpb=CXPB, mutpb=MUTPB, ngen=task["end_gen"],
+        stats=make_stats(), halloffame=hof, verbose=False, cache=cache,
+        start_gen=task["start_gen"], logbook=task["logbook"], constant_fitter=constant_fitter,
+        sampler=sampler, canonicalizer=canonicalizer
     )
+    constant_cache = constant_fitter.snapshot() if constant_fitter is not None else {}
+    sampler_state = sampler.snapshot() if sampler is not None else None
+    fitness_cache = cache.snapshot() if cache is not None else None
+    return dict(task, population=population, logbook=logbook, halloffame=list(hof), constant_cache=constant_cache,
+                sampler_state=sampler_state, fitness_cache=fitness_cache,
+                random_state=random.getstate(), numpy_random_state=np.random.get_state())
+
+
+def migrate(populations, migrants, topology="ring", rng=random):
+    """Move the `migrants` best of each island over the worst of its target island.
+
+    topology: "ring" sends island i to i+1; "random" draws a fresh permutation
+    without fixed points every time.
+    """
+    n = len(populations)
+    if topology == "ring":
+        migarray = [(i + 1) % n for i in range(n)]
+    elif topology == "random":
+        migarray = list(range(n))
+        while n > 1 and any(i == j for i, j in enumerate(migarray)):
+            rng.shuffle(migarray)
+    else:
+        raise ValueError(f"Unknown migration topology: {topology!r}")
+    tools.migRing(populations, migrants, tools.selBest, replacement=tools.selWorst, migarray=migarray)
+
+
+def run_island_model(generations=20, pop_size=200, islands=4, migration_interval=5, migrants=2,
+                     topology="ring", cache_size=100_000, evaluator="batch", verbose=True,
+                     constant_top_k=0, target_rmse=None, patience=None, max_evals=None, max_time=None,
+                     data_path=DATA_PATH, batch_size=None, canonicalize=False, parsimony=None,
+                     constants_path=CONSTANTS_PATH):
+    """Run `islands` sub-populations (pop_size in total) in separate processes.
+
+    Every `migration_interval` generations the islands exchange their best
+    individuals along `topology`, and their halls of fame are merged into one.
+    Island seeds are derived from RANDOM_SEED, so runs are reproducible.
+    Stopping criteria are checked on the merged hall of fame between epochs.
+    With batch_size, islands score generations on mini-batches (see evolve).
+    canonicalize / parsimony apply to every island, and data_path /
+    constants_path are read as in run_symbolic_regression.
+    """
+    X, y, z = prepare_dataset(data_path, constants_path)
+    toolbox, pset = setup_gp()
+    register_evaluators(toolbox, pset, X, y, evaluator)
+
+    rng = random.Random(RANDOM_SEED)
+    tasks = []
+    for i in range(islands):
+        seed = rng.randrange(2 ** 32)
+        tasks.append({
+            "island": i,
+            "population": None,
+            "pop_size": pop_size // islands + (i < pop_size % islands),
+            "logbook": None,
+            "hof_size": 5,
+            "evaluator": evaluator,
+            "cache_size": cache_size,
+            "fitness_cache": None,
+            "constant_top_k": constant_top_k,
+            "constant_cache": {},
+            "batch_size": batch_size,
+            "sampler_state": None,
+            "canonicalize": canonicalize,
+            "parsimony": parsimony,
+            "random_state": random.Random(seed).getstate(),
+            "numpy_random_state": np.random.RandomState(seed).get_state(),
+        })
+
+    hof = tools.HallOfFame(5)
+    log = tools.Logbook()
+    stopping = StoppingCriteria(target_rmse, patience, max_evals, max_time)
+    pool = multiprocessing.Pool(processes=islands, initializer=_init_worker,
+                                initargs=_worker_dataset(data_path, X, y))
+    try:
+        start_gen = 0
+        while True:
+            started = time.perf_counter()
+            end_gen = min(start_gen + migration_interval, generations)
+            seen = [len(task["logbook"] or ()) for task in tasks]
+            for task in tasks:
+                task.update(start_gen=start_gen, end_gen=end_gen)
+            tasks = pool.map(_run_island_epoch, tasks)
+
+            nevals = 0
+            for task, n_seen in zip(tasks, seen):
+                rebind_ephemerals(task["population"], pset)
+                hof.update(rebind_ephemerals(task["halloffame"], pset))
+                for record in task["logbook"][n_seen:]:
+                    log.record(island=task["island"], **record)
+                    nevals += record["nevals"]
+            if verbose:
+                log.header = ["gen", "island"] + [h for h in tasks[0]["logbook"].header if h != "gen"]
+                print(log.stream)
+
+            reason = stopping.update(hof[0].fitness.values[0], nevals, time.perf_counter() - started,
+                                     generations=max(end_gen - start_gen, 1))
+            if reason and verbose:
+                print(f"Stopping after generation {end_gen}: {reason}")
+            if end_gen >= generations or reason:
+                break
+            migrate([task["population"] for task in tasks], migrants, topology, rng)
+            start_gen = end_gen
+    finally:
+        pool.close()
+        pool.join()
+
+    pop = [ind for task in tasks for ind in task["population"]]
     return pop, log, hof, toolbox, pset, X, y, z
 
 
 # -------------------------
-# 5) Display results
+# 9) Display results
 # -------------------------
 def print_results(hof, toolbox, X, y):
     print("\n=== Top discovered expressions ===")
@@ -173,7 +1029,7 @@ def print_results(hof, toolbox, X, y):
 
 
 # -------------------------
-# 6) Main
+# 10) Main
 # -------------------------
 if __name__ == "__main__":
     print("Preparing data and running symbolic regression (this may take a few minutes)...")
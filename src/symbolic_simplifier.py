@@ -1,37 +1,187 @@
 # src/symbolic_simplifier.py
 import sympy as sp
 import json
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def simplify_expression(expr_str: str):
-    """Simplify and analyze the symbolic expression found by the regression engine."""
-    # Define variables
+from instrumentation import span
+from sympy_conversion import parse_expression
+
+SIMPLIFY_CACHE_PATH = Path("data/cache/simplify_cache.jsonl")
+BATCH_OUTPUT_PATH = Path("data/simplified_expressions.jsonl")
+STAGE_TIMEOUT = 10.0  # seconds per SymPy rewrite
+
+# (name, rewrite, cheaper fallbacks applied in order when the rewrite times out)
+STAGES = [
+    ("simplify", sp.simplify, [sp.powsimp, sp.cancel]),
+    ("expand", sp.expand, []),
+    ("factor", sp.factor, [sp.cancel]),
+]
+
+
+# -------------------------
+# 1) Time-bounded rewrites
+# -------------------------
+class StageRunner:
+    """Runs SymPy rewrites in a single worker process with a time limit per call.
+
+    A call that overruns raises multiprocessing.TimeoutError; its worker is
+    terminated and a fresh one is started on the next call. timeout=None runs
+    everything inline with no limit.
+    """
+
+    def __init__(self, timeout=STAGE_TIMEOUT):
+        self.timeout = timeout
+        self.pool = None
+
+    def run(self, func, expr):
+        if self.timeout is None:
+            return func(expr)
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(1)
+        try:
+            return self.pool.apply_async(func, (expr,)).get(self.timeout)
+        except multiprocessing.TimeoutError:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+            raise
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_stage(runner, expr, name, rewrite, fallbacks, timed_out):
+    """Apply `rewrite`; if it times out, apply the fallbacks in turn instead."""
+    with span(f"simplify.{name}"):
+        try:
+            return runner.run(rewrite, expr)
+        except multiprocessing.TimeoutError:
+            timed_out.append(name)
+
+        for fallback in fallbacks:
+            try:
+                expr = runner.run(fallback, expr)
+            except multiprocessing.TimeoutError:
+                timed_out.append(f"{name}:{fallback.__name__}")
+        return expr
+
+
+def derivatives(expr):
+    """Partial derivatives w.r.t. rho and Lambda, as strings."""
     rho, Lambda = sp.symbols("rho Lambda")
+    return str(sp.diff(expr, rho)), str(sp.diff(expr, Lambda))
 
-    # Convert string expression to SymPy object
-    expr = sp.sympify(expr_str, locals={"rho": rho, "Lambda": Lambda, "exp": sp.exp, "mul": sp.Mul})
 
-    # Simplify algebraically
-    simplified = sp.simplify(expr)
+# -------------------------
+# 2) Persistent result cache
+# -------------------------
+_caches = {}
+
+
+def load_simplify_cache(path=SIMPLIFY_CACHE_PATH):
+    """Results keyed by original expression, read once per path from the JSONL file."""
+    path = Path(path)
+    if path not in _caches:
+        cache = {}
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # e.g. a line cut short by an interrupted run
+                    cache[entry["original_expression"]] = entry
+        _caches[path] = cache
+    return _caches[path]
+
+
+def store_simplify_result(result, path=SIMPLIFY_CACHE_PATH):
+    path = Path(path)
+    load_simplify_cache(path)[result["original_expression"]] = result
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(result) + "\n")
+
+
+# -------------------------
+# 3) Simplification pipeline
+# -------------------------
+def analyze_expression(expr_str, timeout=STAGE_TIMEOUT, cache_path=SIMPLIFY_CACHE_PATH, runner=None, expr=None):
+    """Simplified/factored forms and partial derivatives of `expr_str`, as a dict.
+
+    Each SymPy stage gets `timeout` seconds; complete results are cached on
+    disk by the original expression string (cache_path=None disables the
+    cache). Results where a stage timed out are not cached, so a later call
+    with a larger budget computes them properly.
+    expr: SymPy form of `expr_str` if already built; skips string parsing.
+    """
+    if cache_path is not None:
+        cached = load_simplify_cache(cache_path).get(expr_str)
+        if cached is not None and not cached.get("timed_out_stages"):
+            return cached
+
+    # Convert string expression to SymPy object
+    if expr is None:
+        expr = parse_expression(expr_str)
 
-    # Try to expand and factor for clarity
-    expanded = sp.expand(simplified)
-    factored = sp.factor(expanded)
+    own_runner = runner is None
+    runner = StageRunner(timeout) if own_runner else runner
+    timed_out = []
+    try:
+        forms = {}
+        for name, rewrite, fallbacks in STAGES:
+            expr = run_stage(runner, expr, name, rewrite, fallbacks, timed_out)
+            forms[name] = expr
 
-    # Compute partial derivatives to see influence of rho and Lambda
-    d_rho = sp.diff(factored, rho)
-    d_Lambda = sp.diff(factored, Lambda)
+        # Compute partial derivatives to see influence of rho and Lambda
+        try:
+            with span("simplify.derivatives"):
+                d_rho, d_Lambda = runner.run(derivatives, forms["factor"])
+        except multiprocessing.TimeoutError:
+            d_rho = d_Lambda = None
+            timed_out.append("derivatives")
+    finally:
+        if own_runner:
+            runner.close()
 
     result = {
         "original_expression": expr_str,
-        "simplified_expression": str(simplified),
-        "factored_expression": str(factored),
-        "derivative_wrt_rho": str(d_rho),
-        "derivative_wrt_Lambda": str(d_Lambda)
+        "simplified_expression": str(forms["simplify"]),
+        "factored_expression": str(forms["factor"]),
+        "derivative_wrt_rho": d_rho,
+        "derivative_wrt_Lambda": d_Lambda,
+        "timed_out_stages": timed_out,
     }
+    if cache_path is not None and not timed_out:
+        store_simplify_result(result, cache_path)
+    return result
+
+
+def analyze_individual(individual, converter, **kwargs):
+    """analyze_expression for a live GP individual, converted without a string round-trip."""
+    return analyze_expression(str(individual), expr=converter.convert(individual), **kwargs)
+
+
+def simplify_expression(expr_str: str, timeout=STAGE_TIMEOUT, cache_path=SIMPLIFY_CACHE_PATH, expr=None,
+                        output_file="data/simplified_expression.json"):
+    """Simplify and analyze the symbolic expression found by the regression engine."""
+    result = analyze_expression(expr_str, timeout=timeout, cache_path=cache_path, expr=expr)
 
     # Save output for the agent to use later
-    output_file = Path("data/simplified_expression.json")
+    output_file = Path(output_file)
     output_file.parent.mkdir(parents=True, exist_ok=True)
     with open(output_file, "w") as f:
         json.dump(result, f, indent=4)
@@ -44,7 +194,111 @@ def simplify_expression(expr_str: str):
     return result
 
 
+# -------------------------
+# 4) Batch simplification
+# -------------------------
+_worker_runner = None
+
+
+def _init_worker(timeout):
+    global _worker_runner
+    _worker_runner = StageRunner(timeout)
+
+
+def _analyze_in_worker(expr_str):
+    # Pool workers never touch the disk cache; the parent reads and writes it.
+    try:
+        return analyze_expression(expr_str, cache_path=None, runner=_worker_runner)
+    except Exception as e:
+        return {"original_expression": expr_str, "error": str(e)}
+
+
+def load_expressions(path):
+    """(expression, rmse) pairs from a file: JSON lines with "expression" and
+    optional "rmse", or one plain expression per line."""
+    entries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                entries.append((record["expression"], record.get("rmse")))
+            else:
+                entries.append((line, None))
+    return entries
+
+
+def _as_entries(expressions):
+    """Accept a HallOfFame/individuals, (expression, rmse) pairs or plain strings."""
+    entries = []
+    for item in expressions:
+        if hasattr(item, "fitness"):
+            entries.append((str(item), item.fitness.values[0] if item.fitness.valid else None))
+        elif isinstance(item, str):
+            entries.append((item, None))
+        else:
+            entries.append((str(item[0]), item[1]))
+    return entries
+
+
+def simplify_batch(expressions, workers=None, timeout=STAGE_TIMEOUT,
+                   output_path=BATCH_OUTPUT_PATH, cache_path=SIMPLIFY_CACHE_PATH):
+    """Simplify many expressions in a process pool and append them to `output_path`.
+
+    `expressions` is a HallOfFame (or any individuals), (expression, rmse)
+    pairs, plain strings, or a path to a file read with load_expressions.
+    Expressions that simplify to the same form are written once, keeping the
+    lowest RMSE; `variants` counts how many inputs collapsed into each line.
+    """
+    if isinstance(expressions, (str, Path)):
+        entries = load_expressions(expressions)
+    else:
+        entries = _as_entries(expressions)
+
+    cache = load_simplify_cache(cache_path) if cache_path is not None else {}
+    results = {expr: cache[expr] for expr, _ in entries
+               if expr in cache and not cache[expr].get("timed_out_stages")}
+    pending = list(dict.fromkeys(expr for expr, _ in entries if expr not in results))
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(timeout,)) as executor:
+            for result in executor.map(_analyze_in_worker, pending):
+                results[result["original_expression"]] = result
+                if cache_path is not None and "error" not in result and not result["timed_out_stages"]:
+                    store_simplify_result(result, cache_path)
+
+    unique = {}
+    for expr, rmse in entries:
+        result = results[expr]
+        key = result.get("simplified_expression", expr)
+        current = unique.get(key)
+        if current is None:
+            unique[key] = dict(result, rmse=rmse, variants=1)
+            continue
+        current["variants"] += 1
+        if rmse is not None and (current["rmse"] is None or rmse < current["rmse"]):
+            current.update(result, rmse=rmse)
+
+    batch = time.strftime("%Y-%m-%dT%H:%M:%S")
+    records = sorted(unique.values(), key=lambda r: float("inf") if r["rmse"] is None else r["rmse"])
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "a", encoding="utf-8") as f:
+        for record in records:
+            record["batch"] = batch
+            f.write(json.dumps(record) + "\n")
+
+    print(f"✅ {len(entries)} expressions → {len(records)} unique, appended to {output_path}")
+    return records
+
+
 if __name__ == "__main__":
-    # Use the top expression from your symbolic_engine output
-    best_expr = "mul(mul(Lambda, rho), exp(9.015725556127048))"
-    simplify_expression(best_expr)
+    if len(sys.argv) > 1:
+        # File of expressions (plain lines or JSON lines with expression/rmse)
+        simplify_batch(sys.argv[1])
+    else:
+        # Use the top expression from your symbolic_engine output
+        best_expr = "mul(mul(Lambda, rho), exp(9.015725556127048))"
+        simplify_expression(best_expr)
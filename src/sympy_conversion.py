@@ -0,0 +1,76 @@
+# src/sympy_conversion.py
+# Conversion of DEAP GP trees (or their string form) into SymPy expressions.
+
+import operator
+
+import sympy as sp
+
+# SymPy counterpart of every primitive in setup_gp. The protected operators
+# map to their plain form: the guards only matter where the math is undefined.
+SYMPY_PRIMITIVES = {
+    "add": operator.add,
+    "sub": operator.sub,
+    "mul": operator.mul,
+    "protectedDiv": operator.truediv,
+    "neg": operator.neg,
+    "protectedLog": sp.log,
+    "protectedSqrt": sp.sqrt,
+    "sin": sp.sin,
+    "cos": sp.cos,
+    "exp": sp.exp,
+}
+
+
+def sympy_locals(variables=("rho", "Lambda")):
+    """`locals` map for sp.sympify on DEAP expression strings."""
+    names = dict(SYMPY_PRIMITIVES)
+    # Explicit symbols so names such as Lambda are not parsed as SymPy classes.
+    names.update({name: sp.Symbol(name) for name in variables})
+    return names
+
+
+def parse_expression(expr_str, variables=("rho", "Lambda")):
+    """SymPy form of a DEAP expression string such as "mul(rho, exp(1.5))"."""
+    return sp.sympify(expr_str, locals=sympy_locals(variables))
+
+
+class SympyConverter:
+    """Walks PrimitiveTree nodes straight into SymPy objects.
+
+    Converted subtrees are memoized by their string form across calls, so
+    individuals that share subtrees (most of a GP population) only pay for
+    the parts that are new. The memo is cleared once it holds max_cache
+    entries.
+    """
+
+    def __init__(self, pset, max_cache=100_000):
+        self.symbols = {name: sp.Symbol(name) for name in pset.arguments}
+        self.max_cache = max_cache
+        self.cache = {}
+
+    def terminal(self, node):
+        if isinstance(node.value, str):
+            return self.symbols[node.value]
+        if isinstance(node.value, int):
+            return sp.Integer(node.value)
+        # From the repr, so the precision matches parse_expression on str(individual)
+        return sp.Float(repr(float(node.value)))
+
+    def convert(self, individual):
+        # Same reversed prefix walk as population_evaluator.evaluate_tree
+        stack = []
+        for node in reversed(individual):
+            if node.arity == 0:
+                stack.append((node.format(), self.terminal(node)))
+                continue
+
+            args = [stack.pop() for _ in range(node.arity)]
+            key = f"{node.name}({', '.join(k for k, _ in args)})"
+            expr = self.cache.get(key)
+            if expr is None:
+                expr = SYMPY_PRIMITIVES[node.name](*[e for _, e in args])
+                if len(self.cache) >= self.max_cache:
+                    self.cache.clear()
+                self.cache[key] = expr
+            stack.append((key, expr))
+        return stack[0][1]
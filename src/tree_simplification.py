@@ -0,0 +1,133 @@
+# src/tree_simplification.py
+# Cheap structural simplification of DEAP GP trees: constant folding and identity removal.
+
+import math
+
+import numpy as np
+from deap import gp
+
+
+def _ephemeral_class(pset):
+    """The pset's ephemeral constant class, used to create folded constants."""
+    for terminal in pset.terminals[pset.ret]:
+        if isinstance(terminal, gp.MetaEphemeral):
+            return terminal
+    return None
+
+
+def _format_constant(value):
+    return repr(float(value))
+
+
+def _folded_value(result):
+    """A primitive's result as a scalar of the same kind.
+
+    Python floats stay floats; NumPy results (np.float64, 0-d arrays) become
+    np.float64, so e.g. a later division by a folded 0.0 still follows NumPy
+    semantics (inf, then protectedDiv's fallback) instead of raising
+    ZeroDivisionError as a Python float would.
+    """
+    if type(result) is float:
+        return result
+    return np.float64(np.asarray(result, dtype=float))
+
+
+def simplify_tree(individual, pset):
+    """Prefix node list of `individual` with constant subtrees folded and
+    identities (x+0, x-0, x*1, x/1, neg(neg(x)), x-x, x/x) removed.
+
+    Folding calls the same primitives as fitness evaluation and keeps the
+    type of their results, so the shorter tree computes the same values,
+    except where an intermediate result is not finite (x - x becomes 0 even
+    where x is inf).
+    """
+    ephemeral = _ephemeral_class(pset)
+
+    def constant(value):
+        node = ephemeral.__new__(ephemeral)
+        node.value = value
+        node.conv_fct = _format_constant  # plain "0.5", not "np.float64(0.5)"
+        return [node], _format_constant(value), value
+
+    # Stack entries: (prefix nodes, string key, value if the subtree is constant)
+    stack = []
+    for node in reversed(individual):
+        if node.arity == 0:
+            value = None if isinstance(node.value, str) else node.value
+            stack.append(([node], node.format(), value))
+            continue
+
+        args = [stack.pop() for _ in range(node.arity)]
+        if ephemeral is not None and all(value is not None for _, _, value in args):
+            try:
+                with np.errstate(all="ignore"):
+                    value = _folded_value(pset.context[node.name](*[v for _, _, v in args]))
+            except ArithmeticError:
+                value = math.nan  # e.g. float division by zero: leave it to evaluation
+            if math.isfinite(value):
+                stack.append(constant(value))
+                continue
+
+        reduced = _remove_identity(node.name, args, constant if ephemeral is not None else None)
+        if reduced is None:
+            nodes = [node] + [n for sub, _, _ in args for n in sub]
+            reduced = (nodes, f"{node.name}({', '.join(key for _, key, _ in args)})", None)
+        stack.append(reduced)
+    return stack[0][0]
+
+
+def _remove_identity(name, args, constant):
+    """Simplified stack entry for `name(*args)`, or None if no identity applies."""
+    if name == "neg":
+        nodes, key, _ = args[0]
+        if nodes[0].name == "neg":
+            return nodes[1:], key[len("neg("):-1], None
+        return None
+    if len(args) != 2:
+        return None
+
+    a, b = args
+    if name == "add":
+        if a[2] == 0:
+            return b
+        if b[2] == 0:
+            return a
+    elif name == "sub":
+        if b[2] == 0:
+            return a
+        if constant is not None and a[1] == b[1]:
+            return constant(np.float64(0.0))  # x is not constant, so x - x was an array
+    elif name == "mul":
+        if a[2] == 1:
+            return b
+        if b[2] == 1:
+            return a
+    elif name == "protectedDiv":
+        if b[2] == 1:
+            return a
+        if constant is not None and a[1] == b[1]:
+            return constant(np.float64(1.0))
+    return None
+
+
+if __name__ == "__main__":
+    # Regression check: folding constant-only trees must not change their fitness
+    import random
+    from deap import creator
+    import symbolic_engine
+
+    random.seed(1)
+    toolbox, pset = symbolic_engine.setup_gp()
+    X, y, _ = symbolic_engine.prepare_dataset()
+    ephemeral = _ephemeral_class(pset)
+    mismatches = 0
+    for _ in range(2000):
+        nodes = gp.genHalfAndHalf(pset, min_=1, max_=4)
+        tree = creator.Individual([ephemeral() if node.arity == 0 else node for node in nodes])
+        shrunk = creator.Individual(simplify_tree(tree, pset))
+        before = symbolic_engine.evaluate_individual(tree, toolbox.compile, X, y)[0]
+        after = symbolic_engine.evaluate_individual(shrunk, toolbox.compile, X, y)[0]
+        if not np.isclose(before, after, rtol=1e-9, equal_nan=True):
+            mismatches += 1
+            print(f"❌ {tree} ({before}) -> {shrunk} ({after})")
+    print(f"✅ 2000 constant-only trees checked, {mismatches} mismatches")
@@ -0,0 +1,199 @@
+# src/vector_index.py
+# Persistent FAISS index over texts, updated incrementally, with embeddings cached by content hash.
+
+import hashlib
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+EMBED_BATCH_SIZE = 64
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _normalize(vectors):
+    """float32 rows scaled to unit length (zero rows are left as they are)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def _atomic_write(path, write):
+    """Call write(f) on a temp file, fsync it, then swap it in with os.replace."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# -------------------------
+# 1) Embedding cache
+# -------------------------
+class EmbeddingCache:
+    """Normalised embeddings keyed by the SHA-256 of their text.
+
+    Stored as one .npz (hashes + matrix), so identical texts are encoded once
+    across runs. Only texts missing from the cache reach `embed_fn`, in
+    batches of `batch_size`. The file is read on first use, so callers that
+    only search never load it.
+    """
+
+    def __init__(self, path=None, batch_size=EMBED_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._vectors = None
+        self.unsaved = 0
+
+    @property
+    def vectors(self):
+        if self._vectors is None:
+            self._vectors = {}
+            if self.path is not None and os.path.exists(self.path):
+                with np.load(self.path) as data:
+                    self._vectors = dict(zip(data["hashes"].tolist(), data["vectors"]))
+        return self._vectors
+
+    def discard(self, hashes):
+        """Forget the embeddings of texts no longer indexed."""
+        vectors = self.vectors
+        for h in hashes:
+            if vectors.pop(h, None) is not None:
+                self.unsaved += 1
+
+    def embed(self, texts, embed_fn):
+        """(len(texts), dim) float32 matrix of L2-normalised embeddings."""
+        hashes = [content_hash(t) for t in texts]
+        missing = {}
+        for h, text in zip(hashes, texts):
+            if h not in self.vectors:
+                missing.setdefault(h, text)
+
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            vectors = _normalize(embed_fn([text for _, text in batch]))
+            for (h, _), vector in zip(batch, vectors):
+                self.vectors[h] = vector
+            self.unsaved += len(batch)
+
+        if not hashes:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([self.vectors[h] for h in hashes]).astype(np.float32, copy=False)
+
+    def save(self):
+        if self.path is None or not self.unsaved:
+            return
+        hashes = np.array(list(self.vectors))
+        vectors = np.stack(list(self.vectors.values())) if self.vectors else np.empty((0, 0), np.float32)
+        _atomic_write(self.path, lambda f: np.savez(f, hashes=hashes, vectors=vectors))
+        self.unsaved = 0
+
+
+# -------------------------
+# 2) Vector index
+# -------------------------
+class VectorIndex:
+    """Cosine-similarity search over texts identified by integer ids.
+
+    Vectors live in a faiss.IndexIDMap over an inner-product flat index, so
+    new texts are appended with add_with_ids and never trigger a rebuild.
+    The index directory holds index-*.faiss, embeddings.npz and
+    manifest.json; each save writes a new index file and then the manifest
+    pointing at it, so a crash mid-save leaves the previous consistent state.
+    With mmap=True the saved index is memory-mapped rather than read into
+    memory; it is copied into memory on the first add or remove.
+    """
+
+    def __init__(self, path, embed_fn, batch_size=EMBED_BATCH_SIZE, mmap=False):
+        self.path = path
+        self.embed_fn = embed_fn
+        self.index = None
+        self.index_file = None
+        self.mapped = False
+        self.meta = {}
+        self.cache = EmbeddingCache(os.path.join(path, "embeddings.npz"), batch_size)
+        self.load(mmap)
+
+    @property
+    def ntotal(self):
+        return 0 if self.index is None else self.index.ntotal
+
+    def load(self, mmap=False):
+        manifest_path = os.path.join(self.path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.index_file = os.path.join(self.path, manifest["index_file"])
+        # IO_FLAG_MMAP only maps IVF lists; MMAP_IFC (faiss >= 1.10) also maps flat codes
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", None) if mmap else None
+        self.index = faiss.read_index(self.index_file, mmap_flag or 0)
+        self.mapped = mmap_flag is not None
+        self.meta = manifest.get("meta", {})
+
+    def _writable(self):
+        """The index, first read into memory if it is mapped (a mapped index cannot grow)."""
+        if self.mapped:
+            # clone_index would keep viewing the mapping, so read the file again
+            if os.path.exists(self.index_file):
+                self.index = faiss.read_index(self.index_file)
+            else:  # replaced by another process's save; the mapping is still valid
+                self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self.mapped = False
+        return self.index
+
+    def add(self, ids, texts):
+        """Embed `texts` (cached by content hash) and append them under `ids`."""
+        if not texts:
+            return
+        vectors = self.cache.embed(list(texts), self.embed_fn)
+        if self.index is None:
+            self.index = faiss.IndexIDMap(faiss.IndexFlatIP(vectors.shape[1]))
+        self._writable().add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+
+    def remove(self, ids):
+        if self.index is not None and len(ids):
+            self._writable().remove_ids(np.asarray(ids, dtype=np.int64))
+
+    def search(self, query, k=5):
+        """[(id, cosine similarity)] of the k nearest texts, best first."""
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        # Queries are not cached: they would grow the document cache without bound
+        vector = _normalize(self.embed_fn([query]))
+        scores, ids = self.index.search(vector, min(k, self.index.ntotal))
+        return [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i != -1]
+
+    def reset(self):
+        self.index = None
+        self.index_file = None
+        self.mapped = False
+        self.meta = {}
+
+    def save(self, **meta):
+        """Atomically persist the index and embedding cache; `meta` goes in the manifest."""
+        os.makedirs(self.path, exist_ok=True)
+        self.cache.save()
+        if self.index is None:
+            return
+        # Versioned file name: the old index stays valid until the manifest points elsewhere
+        index_file = f"index-{time.time_ns()}-{os.getpid()}.faiss"
+        tmp_path = os.path.join(self.path, index_file + ".tmp")
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, index_file))
+        self.index_file = os.path.join(self.path, index_file)
+
+        self.meta = meta
+        manifest = {"index_file": index_file, "ntotal": self.index.ntotal, "meta": meta}
+        _atomic_write(os.path.join(self.path, "manifest.json"),
+                      lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")))
+        for name in os.listdir(self.path):
+            if name.startswith("index-") and name.endswith(".faiss") and name != index_file:
+                os.remove(os.path.join(self.path, name))